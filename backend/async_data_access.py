@@ -0,0 +1,266 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar
+import sensor_data_access
+from db_config import get_executor_config
+
+T = TypeVar("T")
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("async_data_access")
+
+
+class QueryTimeoutError(Exception):
+    """Raised when an awaited database call does not finish within its timeout"""
+
+
+class DatabaseExecutor:
+    """
+    Bounded thread pool that runs blocking mysql.connector calls off the event
+    loop, so a slow query delays only the request waiting for it.
+
+    The timeout covers time spent queued for a worker as well as the query
+    itself. A timed-out call keeps running in its worker until the driver
+    returns (a thread can't be interrupted), but the request is answered
+    straight away and the worker count bounds how many can pile up.
+    """
+
+    def __init__(
+        self,
+        workers: int = 8,
+        query_timeout: float = 5.0,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.workers = workers
+        self.query_timeout = query_timeout
+        self.logger = logger or get_logger()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="db-executor"
+        )
+        self._lock = threading.Lock()
+
+        # Counters
+        self._in_flight = 0
+        self._calls = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._queue_wait_max = 0.0
+
+    def _call(self, func: Callable[..., T], submitted: float, *args, **kwargs) -> T:
+        with self._lock:
+            self._queue_wait_max = max(
+                self._queue_wait_max, time.monotonic() - submitted
+            )
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> T:
+        """Await a blocking function on the pool, bounded by `timeout` seconds"""
+        timeout = self.query_timeout if timeout is None else timeout
+        with self._lock:
+            self._in_flight += 1
+            self._calls += 1
+
+        future = self._executor.submit(
+            functools.partial(self._call, func, time.monotonic(), *args, **kwargs)
+        )
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+                # A call still waiting for a worker is dropped, not run late
+                if future.cancel():
+                    self._in_flight -= 1
+            name = getattr(func, "__name__", repr(func))
+            self.logger.warning(f"Database call {name} timed out after {timeout}s")
+            raise QueryTimeoutError(f"{name} did not complete within {timeout}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker utilization and timeout counters"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "queued": max(self._in_flight - self.workers, 0),
+                "calls": self._calls,
+                "timeouts": self._timeouts,
+                "errors": self._errors,
+                "queue_wait_seconds_max": self._queue_wait_max,
+            }
+
+    def shutdown(self):
+        """Stop accepting calls; running queries finish in the background"""
+        self._executor.shutdown(wait=False)
+
+
+_config = get_executor_config()
+db_executor = DatabaseExecutor(_config["workers"], _config["query_timeout"])
+HISTORY_TIMEOUT = _config["history_timeout"]
+
+
+def get_db_executor() -> DatabaseExecutor:
+    """Get the process-wide database executor"""
+    return db_executor
+
+
+# Awaitable versions of the sensor_data_access functions. Each takes an
+# optional `timeout` in seconds on top of the original arguments.
+
+
+async def get_sensor_by_id(
+    sensor_id: int,
+    logger: Optional[logging.Logger] = None,
+    timeout: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    return await db_executor.run(
+        sensor_data_access.get_sensor_by_id, sensor_id, logger, timeout=timeout
+    )
+
+
+async def get_sensor_readings(
+    sensor_id: int,
+    logger: Optional[logging.Logger] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    timeout: Optional[float] = HISTORY_TIMEOUT,
+) -> List[Dict[str, Any]]:
+    return await db_executor.run(
+        sensor_data_access.get_sensor_readings,
+        sensor_id,
+        logger,
+        start=start,
+        end=end,
+        limit=limit,
+        after=after,
+        timeout=timeout,
+    )
+
+
+async def iter_sensor_readings(
+    sensor_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    batch_size: int = 1000,
+    logger: Optional[logging.Logger] = None,
+    timeout: Optional[float] = HISTORY_TIMEOUT,
+) -> AsyncIterator[List[Tuple[int, float, datetime]]]:
+    """
+    Stream (id, value, timestamp) readings newest first in batches of
+    batch_size. Each batch is its own keyset query on the executor, so
+    consuming the stream slowly holds neither a worker nor a connection.
+    """
+    while True:
+        rows = await db_executor.run(
+            sensor_data_access.get_readings_batch,
+            sensor_id,
+            start,
+            end,
+            after,
+            batch_size,
+            logger,
+            timeout=timeout,
+        )
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        reading_id, _, timestamp = rows[-1]
+        after = (timestamp, reading_id)
+
+
+async def get_complete_sensor_data(
+    sensor_id: int,
+    logger: Optional[logging.Logger] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    timeout: Optional[float] = HISTORY_TIMEOUT,
+) -> Optional[Dict[str, Any]]:
+    return await db_executor.run(
+        sensor_data_access.get_complete_sensor_data,
+        sensor_id,
+        logger,
+        start=start,
+        end=end,
+        limit=limit,
+        after=after,
+        timeout=timeout,
+    )
+
+
+async def get_sensor_history(
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    resolution: str = "auto",
+    max_points: int = 500,
+    logger: Optional[logging.Logger] = None,
+    timeout: Optional[float] = HISTORY_TIMEOUT,
+) -> Optional[Dict[str, Any]]:
+    return await db_executor.run(
+        sensor_data_access.get_sensor_history,
+        sensor_id,
+        start,
+        end,
+        resolution,
+        max_points,
+        logger,
+        timeout=timeout,
+    )
+
+
+async def get_recent_readings(
+    logger: Optional[logging.Logger] = None, timeout: Optional[float] = None
+) -> Dict[int, List[Dict[str, Any]]]:
+    return await db_executor.run(
+        sensor_data_access.get_recent_readings, logger, timeout=timeout
+    )
+
+
+async def get_all_sensors(
+    logger: Optional[logging.Logger] = None, timeout: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    return await db_executor.run(
+        sensor_data_access.get_all_sensors, logger, timeout=timeout
+    )
+
+
+async def update_relay_state(
+    state: int, logger: Optional[logging.Logger] = None, timeout: Optional[float] = None
+) -> bool:
+    return await db_executor.run(
+        sensor_data_access.update_relay_state, state, logger, timeout=timeout
+    )
+
+
+async def get_latest_relay_state(
+    logger: Optional[logging.Logger] = None, timeout: Optional[float] = None
+) -> Optional[int]:
+    return await db_executor.run(
+        sensor_data_access.get_latest_relay_state, logger, timeout=timeout
+    )
@@ -0,0 +1,115 @@
+"""
+Micro-benchmarks for the per-message and per-request hot spots:
+parse_sensor_data, get_recent_readings and WebSocket JSON serialization.
+
+Run from the backend directory:
+    python benchmarks/bench_micro.py [--number 20000] [--sensors 20]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standins import SQLiteDatabase  # noqa: E402
+from recent_readings import get_recent_buffer  # noqa: E402
+from sensor_data_access import get_recent_readings  # noqa: E402
+from sensor_data_processor import insert_sensor_rows, parse_sensor_data  # noqa: E402
+from db_config import get_db_config  # noqa: E402
+from web_sockets import serialize_message  # noqa: E402
+
+try:
+    import orjson
+except ImportError:  # optional: only used for comparison
+    orjson = None
+
+
+def report(label: str, seconds: float, number: int):
+    print(f"{label:<44}{seconds / number * 1e6:>12.2f} us")
+
+
+def bench_parse(number: int):
+    text = "Current Sensor: 25.467, Temperature Sensor: 30.456, Humidity Sensor: 48.125, Relay Status: 1"
+    wide = ", ".join(f"Sensor {i}: {i * 1.25:.3f}" for i in range(32))
+    report(
+        "parse_sensor_data (4 readings)",
+        timeit.timeit(lambda: parse_sensor_data(text), number=number),
+        number,
+    )
+    report(
+        "parse_sensor_data (32 readings)",
+        timeit.timeit(lambda: parse_sensor_data(wide), number=number),
+        number,
+    )
+
+
+def bench_recent_readings(number: int, sensors: int):
+    db = SQLiteDatabase(sensors=sensors)
+    now = datetime.now()
+    rows = [
+        (sensor_id, float(i), now - timedelta(seconds=i))
+        for sensor_id in range(1, sensors + 1)
+        for i in range(500)
+    ]
+    insert_sensor_rows(rows, get_db_config())
+
+    buffer = get_recent_buffer()
+    report(
+        f"recent readings seed ({sensors} sensors x 500 rows)",
+        timeit.timeit(buffer.seed, number=10),
+        10,
+    )
+    report(
+        f"get_recent_readings ({sensors} sensors x 50)",
+        timeit.timeit(get_recent_readings, number=max(number // 100, 10)),
+        max(number // 100, 10),
+    )
+    db.close()
+
+
+def bench_serialization(number: int):
+    message = {
+        "timestamp": datetime.now().isoformat(),
+        "readings": [
+            {"sensor_id": i, "sensor_name": f"Sensor {i}", "value": 20.0 + i / 8}
+            for i in range(1, 5)
+        ],
+    }
+    report(
+        "json.dumps (send_json default)",
+        timeit.timeit(lambda: json.dumps(message), number=number),
+        number,
+    )
+    report(
+        "serialize_message",
+        timeit.timeit(lambda: serialize_message(message), number=number),
+        number,
+    )
+    if orjson is not None:
+        report(
+            "orjson.dumps",
+            timeit.timeit(lambda: orjson.dumps(message), number=number),
+            number,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--sensors", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{'benchmark':<44}{'per call':>15}")
+    bench_parse(args.number)
+    bench_serialization(args.number)
+    bench_recent_readings(args.number, args.sensors)
+
+
+if __name__ == "__main__":
+    main()
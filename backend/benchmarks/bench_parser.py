@@ -0,0 +1,73 @@
+"""
+Micro-benchmark: payload_parser against the original split + re.match parser.
+The JSON and binary formats have no legacy equivalent and are timed alone.
+
+Run from the backend directory:
+    python benchmarks/bench_parser.py [--number 20000]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payload_parser import parse_payload, encode_binary_payload  # noqa: E402
+
+
+def legacy_parse_sensor_data(message: str) -> List[Tuple[str, float]]:
+    """The parser as it was before payload_parser (uncompiled regex per part)"""
+    sensor_readings = []
+    parts = [p.strip() for p in message.split(",")]
+    for part in parts:
+        match = re.match(r"(.*?):\s*([-+]?\d*\.\d+|\d+)", part)
+        if match:
+            sensor_name = match.group(1).strip()
+            value = float(match.group(2))
+            sensor_readings.append((sensor_name, value))
+    return sensor_readings
+
+
+def make_payloads():
+    names = ["Current Sensor", "Temperature Sensor", "Humidity Sensor", "Relay Status"]
+    values = [25.467, 30.456, 48.125, 1]
+    text = ", ".join(f"{n}: {v}" for n, v in zip(names, values))
+    wide = ", ".join(f"Sensor {i}: {i * 1.25:.3f}" for i in range(32))
+    return {
+        "text (4 readings)": text,
+        "text (32 readings)": wide,
+        "json (4 readings)": json.dumps(dict(zip(names, values))),
+        "binary (4 readings)": encode_binary_payload(zip(range(1, 5), values)),
+        "binary (32 readings)": encode_binary_payload(
+            (i, i * 1.25) for i in range(1, 33)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<22}{'legacy us/msg':>16}{'new us/msg':>14}{'speedup':>10}")
+    for label, payload in make_payloads().items():
+        new = timeit.timeit(lambda: parse_payload(payload), number=args.number)
+        if not isinstance(payload, str) or payload.startswith("{"):
+            legacy_cell, speedup = "n/a", ""
+        else:
+            legacy = timeit.timeit(
+                lambda: legacy_parse_sensor_data(payload), number=args.number
+            )
+            legacy_cell = f"{legacy / args.number * 1e6:.2f}"
+            speedup = f"{legacy / new:.2f}x"
+        print(
+            f"{label:<22}{legacy_cell:>16}{new / args.number * 1e6:>14.2f}{speedup:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Load test: synthetic device traffic through the real MQTTHandler, ingest
+pipeline, database writer and ConnectionManager.broadcast, with a loopback
+MQTT broker and a SQLite database standing in for the real ones.
+
+Run from the backend directory:
+    python benchmarks/bench_pipeline.py [--rate 2000] [--duration 10]
+        [--sensors 4] [--clients 50] [--format text|json|binary] [--max-rate 2]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.standins import (  # noqa: E402
+    LoopbackBroker,
+    RecordingWebSocket,
+    SQLiteDatabase,
+)
+from ingest_pipeline import IngestPipeline  # noqa: E402
+from mqtt_client import MQTTHandler  # noqa: E402
+from payload_parser import encode_binary_payload  # noqa: E402
+from sensor_registry import get_sensor_registry  # noqa: E402
+from tracing import current_trace, get_tracer  # noqa: E402
+from web_sockets import ConnectionManager  # noqa: E402
+
+
+def make_payloads(sensor_names, fmt: str, variants: int = 64):
+    """Distinct payloads carrying one reading per sensor"""
+    payloads = []
+    for n in range(variants):
+        values = [
+            round(20 + (n * 7 + i * 3) % 25 + 0.125, 3)
+            for i in range(len(sensor_names))
+        ]
+        if fmt == "json":
+            payloads.append(json.dumps(dict(zip(sensor_names, values))))
+        elif fmt == "binary":
+            payloads.append(
+                encode_binary_payload(zip(range(1, len(values) + 1), values))
+            )
+        else:
+            payloads.append(
+                ", ".join(f"{s}: {v}" for s, v in zip(sensor_names, values))
+            )
+    return payloads
+
+
+async def measure_client_memory(
+    manager: ConnectionManager, clients: int, max_rate: float = None
+) -> float:
+    """Bytes allocated per connected client (connection, queue, writer task)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sockets = [RecordingWebSocket() for _ in range(clients)]
+    for websocket in sockets:
+        await manager.connect(websocket, max_rate=max_rate)
+    await asyncio.sleep(0)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return grown / clients if clients else 0.0
+
+
+async def run(args):
+    db = SQLiteDatabase(sensors=args.sensors)
+    registry = get_sensor_registry()
+    registry.load()
+
+    loop = asyncio.get_running_loop()
+    manager = ConnectionManager(max_queue=1000)
+    per_client = await measure_client_memory(manager, args.clients, args.max_rate)
+
+    def broadcast(data):
+        # Same hand-off as MQTTHandler.dispatch_sensor_data, without main.py
+        trace = current_trace()
+        if trace:
+            trace.expect(1)
+        asyncio.run_coroutine_threadsafe(manager.broadcast(data, trace), loop)
+
+    pipeline = IngestPipeline(batch_size=args.batch_size, flush_interval=0.2)
+    pipeline.add_listener(broadcast)
+    handler = MQTTHandler(client_id="bench")
+    handler.set_ingest_pipeline(pipeline)
+    broker = LoopbackBroker()
+    broker.attach(handler)
+
+    payloads = make_payloads(db.sensor_names, args.format)
+    pipeline.start()
+    started = time.monotonic()
+    publisher = broker.run("sensors/data", payloads, args.rate, args.duration)
+    while publisher.is_alive():
+        await asyncio.sleep(0.05)
+    published_in = time.monotonic() - started
+
+    # Let the writer drain and the clients catch up
+    await loop.run_in_executor(None, pipeline.stop, 60.0)
+    while any(not client.queue.empty() for client in manager._clients.values()):
+        await asyncio.sleep(0.01)
+    elapsed = time.monotonic() - started
+
+    stats = pipeline.stats()
+    stages = get_tracer().percentiles()
+    total = stages.get("total", {})
+    send = stages.get("send", {})
+    commit = stages.get("commit", {})
+
+    print(
+        f"format {args.format}, {args.sensors} sensors, {args.clients} clients, "
+        f"target {args.rate} msgs/s for {args.duration}s"
+    )
+    print(
+        f"published          {broker.published} msgs ({broker.published / published_in:,.0f}/s)"
+    )
+    print(
+        f"processed          {stats['processed']} msgs ({stats['processed'] / elapsed:,.0f}/s)"
+    )
+    print(f"dropped            {stats['dropped']} msgs")
+    print(
+        f"DB rows written    {stats['rows_written']} ({stats['rows_written'] / elapsed:,.0f} rows/s, {db.count_rows()} in table)"
+    )
+    enqueue = stages.get("enqueue", {})
+    print(
+        f"enqueue latency    p50 {enqueue.get('p50_ms', 0):.2f} ms, p99 {enqueue.get('p99_ms', 0):.2f} ms"
+    )
+    print(
+        f"send latency       p50 {send.get('p50_ms', 0):.2f} ms, p99 {send.get('p99_ms', 0):.2f} ms"
+    )
+    print(
+        f"commit latency     p50 {commit.get('p50_ms', 0):.2f} ms, p99 {commit.get('p99_ms', 0):.2f} ms"
+    )
+    print(
+        f"end-to-end (total) p50 {total.get('p50_ms', 0):.2f} ms, p99 {total.get('p99_ms', 0):.2f} ms"
+    )
+    print(f"memory per client  {per_client / 1024:.1f} KiB")
+    frames = sum(client.sent for client in manager._clients.values())
+    print(
+        f"frames sent        {frames} ({frames / elapsed / max(args.clients, 1):,.1f}/s per client)"
+    )
+
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=2000, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--sensors", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--max-rate", type=float, default=None, help="per-client updates per second"
+    )
+    parser.add_argument("--format", choices=["text", "json", "binary"], default="text")
+    args = parser.parse_args()
+
+    # Keep log output from dominating the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
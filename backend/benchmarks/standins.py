@@ -0,0 +1,270 @@
+"""
+In-process stand-ins used by the benchmarks: a SQLite database behind the
+real connection pool, a loopback MQTT broker feeding MQTTHandler._on_message,
+and WebSocket clients that record what they receive.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_config import get_db_config  # noqa: E402
+from db_pool import ConnectionPool, register_pool  # noqa: E402
+
+SENSOR_NAMES = [
+    "Current Sensor",
+    "Temperature Sensor",
+    "Humidity Sensor",
+    "Relay Status",
+]
+
+SCHEMA = """
+CREATE TABLE sensors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    type VARCHAR(50)
+);
+CREATE TABLE sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sensor_id INT NOT NULL,
+    value DOUBLE NOT NULL,
+    timestamp DATETIME NOT NULL
+);
+CREATE INDEX idx_sensor_data_sensor_time ON sensor_data (sensor_id, timestamp);
+""" + "".join(
+    f"""
+CREATE TABLE {table} (
+    sensor_id INT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (sensor_id, bucket_start)
+);
+"""
+    for table in ("sensor_data_1m", "sensor_data_1h", "sensor_data_1d")
+)
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda raw: datetime.fromisoformat(raw.decode()))
+
+
+def _translate(sql: str) -> str:
+    """Rewrite the MySQL dialect used by the data-access code for SQLite"""
+    sql = sql.replace("%s", "?")
+    sql = sql.replace(
+        "ON DUPLICATE KEY UPDATE", "ON CONFLICT (sensor_id, bucket_start) DO UPDATE SET"
+    )
+    sql = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", sql)
+    return sql.replace("LEAST(", "MIN(").replace("GREATEST(", "MAX(")
+
+
+class SQLiteCursor:
+    """The subset of the mysql.connector cursor API the backend uses"""
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+        self.lastrowid: Optional[int] = None
+        self.rowcount = -1
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([c[0] for c in self._cursor.description], row))
+
+    def execute(self, sql: str, params: Any = ()):
+        self._cursor.execute(_translate(sql), tuple(params or ()))
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, sql: str, rows: List[Tuple]):
+        self._cursor.executemany(_translate(sql), rows)
+        self.rowcount = self._cursor.rowcount
+        if sql.lstrip().upper().startswith("INSERT INTO SENSOR_DATA "):
+            # Like MySQL's multi-row INSERT: report the ID of the first row
+            last = self._cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self.lastrowid = last - len(rows) + 1
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def fetchmany(self, size: int):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """The subset of the mysql.connector connection API the backend uses"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=30,
+        )
+        self.autocommit = True
+
+    def cursor(self, dictionary: bool = False, buffered: bool = True):
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def start_transaction(self):
+        self._conn.execute("BEGIN")
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteDatabase:
+    """
+    A throw-away SQLite file installed as the pool for get_db_config(), so the
+    real data-access code runs unchanged against it
+    """
+
+    def __init__(self, sensors: int = 4, pool_size: int = 10):
+        handle, self.path = tempfile.mkstemp(suffix=".sqlite3", prefix="bench-")
+        os.close(handle)
+        setup = sqlite3.connect(self.path)
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.executescript(SCHEMA)
+        names = SENSOR_NAMES + [
+            f"Sensor {i}" for i in range(len(SENSOR_NAMES), sensors)
+        ]
+        setup.executemany(
+            "INSERT INTO sensors (name, type) VALUES (?, ?)",
+            [(name, "bench") for name in names[:sensors]],
+        )
+        setup.commit()
+        setup.close()
+        self.sensor_names = names[:sensors]
+
+        self.pool = ConnectionPool(
+            get_db_config(),
+            size=pool_size,
+            connect=lambda **_: SQLiteConnection(self.path),
+        )
+        register_pool(get_db_config(), self.pool)
+
+    def count_rows(self) -> int:
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+        finally:
+            conn.close()
+
+    def close(self):
+        self.pool.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+
+
+class Message:
+    """Shape of a paho MQTTMessage as seen by _on_message"""
+
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+class LoopbackBroker:
+    """
+    Delivers published messages to subscribed handlers' _on_message on one
+    network thread, like paho's loop thread does for a real broker
+    """
+
+    def __init__(self):
+        self._handlers = []
+
+    def attach(self, handler):
+        self._handlers.append(handler)
+
+    def run(
+        self,
+        topic: str,
+        payloads: List[Any],
+        rate: float,
+        duration: float,
+    ) -> threading.Thread:
+        """Publish payloads round-robin at `rate` msgs/s for `duration` seconds"""
+
+        def publish():
+            interval = 1.0 / rate
+            start = time.monotonic()
+            sent = 0
+            while True:
+                now = time.monotonic()
+                if now - start >= duration:
+                    break
+                # Catch up in bursts when the handler fell behind the schedule
+                due = int((now - start) * rate) + 1
+                while sent < due:
+                    payload = payloads[sent % len(payloads)]
+                    if isinstance(payload, str):
+                        payload = payload.encode()
+                    message = Message(topic, payload)
+                    for handler in self._handlers:
+                        handler._on_message(None, None, message)
+                    sent += 1
+                next_at = start + sent * interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self.published = sent
+
+        self.published = 0
+        thread = threading.Thread(target=publish, name="loopback-broker")
+        thread.start()
+        return thread
+
+
+class RecordingWebSocket:
+    """WebSocket stand-in that counts the frames a client would receive"""
+
+    def __init__(self):
+        self.received = 0
+        self.bytes = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received += 1
+        self.bytes += len(text)
+        # Yield like a real socket write would
+        await asyncio.sleep(0)
+
+    async def close(self, code: int = 1000):
+        pass
@@ -1,3 +1,4 @@
+import os
 from typing import Dict, Any
 
 
@@ -13,3 +14,60 @@ def get_db_config() -> Dict[str, Any]:
         "database": "fastapi_db",
         "port": 3306,
     }
+
+
+def get_pool_config() -> Dict[str, Any]:
+    """
+    Connection pool configuration
+    Returns a dictionary with the pool size and checkout settings
+    """
+    return {
+        "size": 10,  # Maximum number of open connections
+        "checkout_timeout": 5.0,  # Seconds to wait for a free connection
+        "health_check_interval": 30.0,  # Ping connections idle longer than this
+    }
+
+
+def get_retention_config() -> Dict[str, Any]:
+    """
+    sensor_data partitioning and retention settings
+    Returns a dictionary read by partitions.py
+    """
+    return {
+        "partitioning": False,  # Convert sensor_data to monthly range partitions
+        "months_ahead": 3,  # Empty future partitions kept ready for new rows
+        "retention_days": None,  # Drop raw readings older than this; None keeps all
+        "archive": False,  # Move expired readings to archive tables instead
+        "interval": 3600.0,  # Seconds between maintenance runs
+    }
+
+
+def get_executor_config() -> Dict[str, Any]:
+    """
+    Thread-pool settings for database calls made from async routes
+    Returns a dictionary read by async_data_access.py
+    """
+    return {
+        "workers": 8,  # Keep below the pool size so ingest always gets a connection
+        "query_timeout": 5.0,  # Default seconds an awaited query may take
+        "history_timeout": 15.0,  # Range scans over readings and rollups
+    }
+
+
+def get_spool_config() -> Dict[str, Any]:
+    """
+    Local disk spool for ingest rows the database can't take right now
+    Returns a dictionary read by spool.py
+    """
+    return {
+        "enabled": False,  # Spool rows instead of losing them when inserts fail
+        # Absolute, so it doesn't depend on the working directory (git-ignored);
+        # worker processes use a worker-<n> subdirectory
+        "directory": os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool"),
+        "segment_size": 16 * 1024 * 1024,  # Bytes per memory-mapped segment file
+        "max_bytes": 1024 * 1024 * 1024,  # Disk budget; the oldest segment is dropped
+        "sync_interval": 1.0,  # Seconds between msyncs of the current segment
+        "replay_batch_size": 5000,  # Rows per INSERT when draining the spool
+        "replay_interval": 0.5,  # Seconds between checks for rows to replay
+        "replay_stall_after": 5,  # Failed replays before live rows skip the backlog
+    }
@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import mysql.connector
+from db_config import get_db_config, get_pool_config
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("db_pool")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of MySQL connections shared by all data-access functions.
+
+    Connections are created lazily up to `size` and run in autocommit mode so
+    a returned connection never holds a stale read snapshot; writers that need
+    several statements to be atomic call start_transaction() themselves.
+
+    On checkout, a connection that has been idle longer than
+    `health_check_interval` is pinged and reconnected if the server dropped
+    it. Connections that raised while borrowed are discarded instead of being
+    returned to the pool.
+    """
+
+    def __init__(
+        self,
+        db_config: Dict[str, Any],
+        size: int = 10,
+        checkout_timeout: float = 5.0,
+        health_check_interval: float = 30.0,
+        connect: Optional[Callable[..., Any]] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.db_config = dict(db_config)
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.logger = logger or get_logger()
+        self._connect = connect or mysql.connector.connect
+
+        # Idle connections with the monotonic time they were returned
+        self._idle: List[Tuple[Any, float]] = []
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _new_connection(self):
+        conn = self._connect(**self.db_config)
+        conn.autocommit = True
+        return conn
+
+    def _check_health(self, conn, idle_since: float):
+        """Return a usable connection, reconnecting it if it went stale"""
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return conn
+        try:
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return conn
+        except Exception as e:
+            self.logger.warning(f"Stale pooled connection replaced: {str(e)}")
+            self._close_quietly(conn)
+            with self._cond:
+                self._reconnects += 1
+            return self._new_connection()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Borrow a connection, waiting up to checkout_timeout for a free slot"""
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    create = False
+                    break
+                if self._open < self.size:
+                    conn, idle_since = None, start
+                    self._open += 1
+                    create = True
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.checkout_timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        # Connect and health-check outside the lock so other threads are not held up
+        try:
+            if create:
+                return self._new_connection()
+            return self._check_health(conn, idle_since)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        """Return a borrowed connection; discarded connections are closed"""
+        if discard or self._closed:
+            self._close_quietly(conn)
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._open -= 1
+                if discard:
+                    self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Context manager that borrows a connection and always gives it back"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # The connection may be broken mid-query, or an abandoned streaming
+            # read may have left unread rows on it; don't hand it to anyone else
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool utilization and wait time"""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "utilization": self._in_use / self.size if self.size else 0.0,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "reconnects": self._reconnects,
+                "discarded": self._discarded,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "wait_seconds_avg": (
+                    self._wait_total / self._checkouts if self._checkouts else 0.0
+                ),
+            }
+
+    def close(self):
+        """Close all idle connections; borrowed ones are closed on release"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+# Process-wide pools, one per distinct database configuration
+_pools: Dict[Tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _config_key(db_config: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in db_config.items()))
+
+
+def get_pool(db_config: Optional[Dict[str, Any]] = None) -> ConnectionPool:
+    """Get (or lazily create) the shared pool for a database configuration"""
+    db_config = db_config or get_db_config()
+    key = _config_key(db_config)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_config, **get_pool_config())
+                _pools[key] = pool
+    return pool
+
+
+def register_pool(db_config: Dict[str, Any], pool: ConnectionPool):
+    """Install a custom pool for a configuration (benchmarks, tools)"""
+    with _pools_lock:
+        _pools[_config_key(db_config)] = pool
+
+
+@contextmanager
+def pooled_connection(db_config: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+    """Borrow a connection from the shared pool for the given configuration"""
+    with get_pool(db_config).connection() as conn:
+        yield conn
+
+
+def get_pool_stats() -> List[Dict[str, Any]]:
+    """Stats for every pool created in this process"""
+    return [
+        {
+            "host": pool.db_config.get("host"),
+            "database": pool.db_config.get("database"),
+            **pool.stats(),
+        }
+        for pool in list(_pools.values())
+    ]
+
+
+def close_all_pools():
+    """Close every shared pool (called on application shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,319 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from threading import Thread
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from db_config import get_db_config
+from sensor_data_processor import insert_sensor_rows_isolating, prepare_sensor_message
+from tracing import Trace, get_tracer, set_current_trace
+
+if TYPE_CHECKING:
+    from spool import Spool
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("ingest_pipeline")
+
+
+class IngestPipeline:
+    """
+    Write-behind ingest stage for the sensors/data topic.
+
+    The MQTT network thread only calls submit(), which appends the raw payload
+    to a bounded queue. A background worker parses each message, hands the
+    processed result to the registered listeners (WebSocket broadcast etc.)
+    straight away, and buffers the rows for sensor_data. Buffered rows are
+    written with one multi-row INSERT when `batch_size` rows are pending or
+    the oldest pending row is `flush_interval` seconds old. If the database
+    rejects a batch, it is retried in halves so only the offending rows are
+    lost (counted in rows_rejected).
+
+    When the queue is full, `overflow="drop_oldest"` discards the oldest
+    queued message, while `overflow="block"` makes submit() wait up to
+    `block_timeout` seconds for room (pushing back on the broker) before
+    dropping the new message.
+
+    With a `spool`, rows the database can't take are written to local disk
+    instead of being lost. A batch the database is unavailable for goes to
+    the spool, and while the spool has a backlog (or the queue is half full
+    because the database is slow) batches go straight to it, keeping rows in
+    order and the writer from stalling. A SpoolReplayer drains it once the
+    database catches up; if its replay stops making progress, live batches
+    go back to the database first.
+    """
+
+    OVERFLOW_POLICIES = ("drop_oldest", "block")
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        max_queue: int = 10000,
+        overflow: str = "drop_oldest",
+        block_timeout: float = 1.0,
+        db_config: Optional[Dict[str, Any]] = None,
+        spool: Optional["Spool"] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow!r}, use one of {self.OVERFLOW_POLICIES}"
+            )
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.db_config = db_config or get_db_config()
+        self.spool = spool
+        self.logger = logger or get_logger()
+
+        # Raw payloads with their monotonic MQTT receive time
+        self._queue: Deque[Tuple[Union[str, bytes], Optional[float]]] = deque()
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        # Rows queued by listeners, written with the current batch
+        self._extra_rows: List[Tuple[int, float, datetime]] = []
+        self._thread: Optional[Thread] = None
+        self._stopping = False
+
+        # Counters
+        self._submitted = 0
+        self._dropped = 0
+        self._processed = 0
+        self._rows_written = 0
+        self._rows_failed = 0
+        self._rows_rejected = 0
+        self._rows_spooled = 0
+        self._flushes = 0
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """Register a callback invoked with every processed message"""
+        self._listeners.append(callback)
+
+    def add_rows(self, rows: List[Tuple[int, float, datetime]]):
+        """
+        Write already-resolved rows with the batch being built instead of in
+        a separate INSERT, e.g. the rule engine's relay changes, which are
+        made from a listener on the writer thread and must not block it
+        """
+        with self._cond:
+            self._extra_rows.extend(rows)
+            self._cond.notify_all()
+
+    def submit(
+        self, payload: Union[str, bytes], received: Optional[float] = None
+    ) -> bool:
+        """
+        Queue a raw sensors/data payload, with the time.monotonic() it was
+        received at for latency tracing; returns False if it was dropped
+        """
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == "drop_oldest":
+                    self._queue.popleft()
+                    self._dropped += 1
+                else:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_queue and not self._stopping:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._dropped += 1
+                            return False
+                        self._cond.wait(remaining)
+
+            self._queue.append((payload, received))
+            self._submitted += 1
+            self._cond.notify_all()
+        return True
+
+    def start(self):
+        """Start the background worker"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="ingest-writer")
+        self._thread.daemon = True
+        self._thread.start()
+        self.logger.info(
+            f"Ingest pipeline started (batch {self.batch_size} rows / "
+            f"{self.flush_interval * 1000:.0f} ms, queue {self.max_queue}, {self.overflow})"
+        )
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the worker after draining the queue and flushing pending rows"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                self.logger.warning("Ingest pipeline did not drain before shutdown")
+            self._thread = None
+
+    def _run(self):
+        pending: List[Tuple[int, float, datetime]] = []
+        # Traces of the messages whose rows are in `pending`, with the slice
+        # of `pending` they own
+        pending_traces: List[Tuple[Trace, int, int]] = []
+        deadline: Optional[float] = None
+
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping and not self._extra_rows:
+                    if deadline is None:
+                        self._cond.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                stopping = self._stopping and not self._queue
+                # Wake producers blocked on a full queue
+                self._cond.notify_all()
+
+            for payload, received in batch:
+                rows, trace = self._process(payload, received)
+                if rows:
+                    if not pending:
+                        deadline = time.monotonic() + self.flush_interval
+                    if trace:
+                        pending_traces.append(
+                            (trace, len(pending), len(pending) + len(rows))
+                        )
+                    pending.extend(rows)
+                elif trace:
+                    # Nothing to commit for this message
+                    trace.done()
+
+            # Rows queued by listeners (or other threads) since the last pass
+            with self._cond:
+                extra, self._extra_rows = self._extra_rows, []
+            if extra:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.extend(extra)
+
+            if pending and (
+                stopping
+                or len(pending) >= self.batch_size
+                or time.monotonic() >= deadline
+            ):
+                reached = self._flush(pending)
+                for trace, start, end in pending_traces:
+                    stages = set(reached[start:end])
+                    # A message with lost rows reached neither stage
+                    if None not in stages:
+                        trace.mark("spool" if "spool" in stages else "commit")
+                    trace.done()
+                pending = []
+                pending_traces = []
+                deadline = None
+
+            if stopping and not pending:
+                return
+
+    def _process(
+        self, payload: Union[str, bytes], received: Optional[float]
+    ) -> Tuple[List[Tuple[int, float, datetime]], Optional[Trace]]:
+        trace = get_tracer().start(received) if received is not None else None
+        if trace:
+            trace.mark("queue")
+
+        prepared = prepare_sensor_message(payload, self.logger)
+        if prepared is None:
+            if trace:
+                trace.done()
+            return [], None
+
+        rows, result = prepared
+        self._processed += 1
+        if trace:
+            trace.mark("parse")
+
+        # Listeners that hand the message on (the WebSocket broadcast) pick
+        # the trace up from the thread
+        set_current_trace(trace)
+        try:
+            for listener in self._listeners:
+                try:
+                    listener(result)
+                except Exception as e:
+                    self.logger.error(f"Error in ingest listener: {str(e)}")
+        finally:
+            set_current_trace(None)
+        return rows, trace
+
+    def _flush(self, rows: List[Tuple[int, float, datetime]]) -> List[Optional[str]]:
+        """
+        Write (or spool) a batch; returns where each row ended up: "commit",
+        "spool", or None if it was rejected or lost
+        """
+        self._flushes += 1
+        if self.spool is not None and (
+            self.spool.diverting() or len(self._queue) >= self.max_queue // 2
+        ):
+            return [self._spool(rows)] * len(rows)
+
+        # A row the database refuses is dropped on its own, not with its batch
+        outcome = insert_sensor_rows_isolating(rows, self.db_config, self.logger)
+        self._rows_written += outcome.written
+        self._rows_rejected += len(outcome.rejected)
+        if outcome.failed and self.spool is not None:
+            failed_stage = self._spool(outcome.failed)
+        else:
+            self._rows_failed += len(outcome.failed)
+            failed_stage = None
+
+        # The failed rows are the tail of the batch; rejected rows come back
+        # as the same tuples that were passed in
+        handled = len(rows) - len(outcome.failed)
+        rejected = {id(row) for row in outcome.rejected}
+        reached: List[Optional[str]] = [
+            None if id(row) in rejected else "commit" for row in rows[:handled]
+        ]
+        reached.extend([failed_stage] * len(outcome.failed))
+        return reached
+
+    def _spool(self, rows: List[Tuple[int, float, datetime]]) -> Optional[str]:
+        try:
+            self._rows_spooled += self.spool.append(rows)
+        except Exception as e:
+            self.logger.error(f"Error spooling {len(rows)} rows: {str(e)}")
+            self._rows_failed += len(rows)
+            return None
+        return "spool"
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput counters"""
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "overflow": self.overflow,
+            "submitted": self._submitted,
+            "dropped": self._dropped,
+            "processed": self._processed,
+            "flushes": self._flushes,
+            "rows_written": self._rows_written,
+            "rows_failed": self._rows_failed,
+            "rows_rejected": self._rows_rejected,
+            "rows_spooled": self._rows_spooled,
+        }
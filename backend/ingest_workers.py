@@ -0,0 +1,258 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from threading import Thread
+from typing import Any, Callable, Dict, List, Optional
+from log_control import get_verbose_topics
+from sensor_data_processor import notify_write_listeners
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("ingest_workers")
+
+
+def _worker_main(
+    index: int,
+    broker: str,
+    port: int,
+    topic: str,
+    pipeline_options: Dict[str, Any],
+    results: "multiprocessing.Queue",
+    control: "multiprocessing.Queue",
+    stop_event: "multiprocessing.synchronize.Event",
+):
+    """
+    Entry point of one ingest worker process: its own MQTT client on the shared
+    subscription, its own parser and batched writer, a results queue back
+    to the API process, and a control queue for runtime switches from it.
+    """
+    # Imported here so the API process does not pay for them at import time
+    import os
+    from db_config import get_spool_config
+    from ingest_pipeline import IngestPipeline
+    from mqtt_client import MQTTHandler
+    from sensor_data_processor import add_write_listener
+    from sensor_registry import get_sensor_registry
+    from log_control import start_queue_logging
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    start_queue_logging()
+    logger = logging.getLogger(f"ingest_worker.{index}")
+
+    def forward(kind: str, item: Any):
+        try:
+            results.put((kind, item), timeout=1.0)
+        except queue.Full:
+            logger.warning(
+                f"Result queue full, {kind} not forwarded to the API process"
+            )
+
+    get_sensor_registry().load(logger)
+
+    # A spool per worker: two processes must never append to the same segments
+    spool = replayer = None
+    spool_config = get_spool_config()
+    if spool_config["enabled"]:
+        from spool import open_spool
+
+        spool, replayer = open_spool(
+            os.path.join(spool_config["directory"], f"worker-{index}"), logger
+        )
+        replayer.start()
+    pipeline = IngestPipeline(logger=logger, spool=spool, **pipeline_options)
+    pipeline.add_listener(lambda data: forward("message", data))
+    add_write_listener(lambda rows: forward("rows", rows))
+    pipeline.start()
+
+    handler = MQTTHandler(
+        broker=broker, port=port, client_id=f"ingest_worker_{index}", logger=logger
+    )
+    handler.set_ingest_pipeline(pipeline)
+    handler.start()
+    handler.subscribe(topic)
+
+    # ("verbose", topic, seconds) switches a topic on, seconds=None off again
+    verbose_topics = get_verbose_topics()
+    while not stop_event.is_set():
+        try:
+            command, topic, duration = control.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if command == "verbose" and duration:
+            verbose_topics.enable(topic, duration)
+        elif command == "verbose":
+            verbose_topics.disable(topic)
+    handler.stop()
+    pipeline.stop()
+    if spool:
+        replayer.stop()
+        spool.close()
+
+
+class IngestWorkerPool:
+    """
+    Multi-process ingest for the sensors/data topic.
+
+    Each worker process subscribes to the topic through an MQTT shared
+    subscription ($share/<group>/<topic>), so the broker spreads messages
+    across workers and parsing and database writes scale with the number of
+    processes. Workers send processed messages and committed rows back over a
+    multiprocessing queue; a forwarder thread in the API process hands them
+    to the registered listeners (rule engine, WebSocket broadcast) and to the
+    sensor_data write listeners, exactly as the in-process IngestPipeline
+    would. Messages from one sensor may be handled by different workers, so
+    ordering across workers is not guaranteed.
+
+    Dead workers are restarted. The pool offers the same add_listener /
+    start / stop / stats interface as IngestPipeline.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        broker: str,
+        port: int,
+        topic: str = "sensors/data",
+        share_group: str = "ingest",
+        pipeline_options: Optional[Dict[str, Any]] = None,
+        max_results: int = 10000,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.workers = workers
+        self.broker = broker
+        self.port = port
+        self.topic = f"$share/{share_group}/{topic}"
+        self.pipeline_options = pipeline_options or {}
+        self.logger = logger or get_logger()
+
+        # spawn: never fork the API process with its event loop and sockets
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue(max_results)
+        self._controls = [self._context.Queue() for _ in range(workers)]
+        self._stop_event = self._context.Event()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._forwarder: Optional[Thread] = None
+        self._stopping = threading.Event()
+
+        # Counters
+        self._messages = 0
+        self._rows = 0
+        self._restarts = 0
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """Register a callback invoked with every processed message"""
+        self._listeners.append(callback)
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index,
+                self.broker,
+                self.port,
+                self.topic,
+                self.pipeline_options,
+                self._results,
+                self._controls[index],
+                self._stop_event,
+            ),
+            name=f"ingest-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        # A restarted worker picks up the topics that are verbose right now
+        for topic, remaining in get_verbose_topics().active().items():
+            self._controls[index].put(("verbose", topic, remaining))
+
+    def set_verbose(self, topic: str, duration: Optional[float]):
+        """
+        Switch full per-message logging for `topic` on for `duration` seconds
+        (or off with None) in every worker, where sensors/data is parsed
+        """
+        for control in self._controls:
+            control.put(("verbose", topic, duration))
+
+    def start(self):
+        """Start the worker processes and the result forwarder"""
+        self._stopping.clear()
+        self._stop_event.clear()
+        for index in range(self.workers):
+            self._spawn(index)
+        self._forwarder = Thread(target=self._forward, name="ingest-forwarder")
+        self._forwarder.daemon = True
+        self._forwarder.start()
+        self.logger.info(f"Started {self.workers} ingest workers on {self.topic}")
+
+    def stop(self, timeout: float = 10.0):
+        """Let every worker flush and exit, then stop forwarding"""
+        self._stopping.set()
+        self._stop_event.set()
+        for process in self._processes:
+            if process:
+                process.join(timeout)
+                if process.is_alive():
+                    self.logger.warning(f"{process.name} did not exit, terminating")
+                    process.terminate()
+        if self._forwarder:
+            self._forwarder.join(timeout)
+            self._forwarder = None
+
+    def _restart_dead_workers(self):
+        for index, process in enumerate(self._processes):
+            if process and not process.is_alive() and not self._stopping.is_set():
+                self.logger.error(
+                    f"{process.name} exited with code {process.exitcode}, restarting"
+                )
+                self._restarts += 1
+                self._spawn(index)
+
+    def _forward(self):
+        next_check = time.monotonic() + 1.0
+        while True:
+            # Check on the workers about once a second, even under full load
+            if time.monotonic() >= next_check:
+                self._restart_dead_workers()
+                next_check = time.monotonic() + 1.0
+
+            try:
+                kind, item = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping.is_set() and not any(
+                    process and process.is_alive() for process in self._processes
+                ):
+                    return
+                continue
+
+            if kind == "rows":
+                self._rows += len(item)
+                notify_write_listeners(item, self.logger)
+                continue
+
+            self._messages += 1
+            for listener in self._listeners:
+                try:
+                    listener(item)
+                except Exception as e:
+                    self.logger.error(f"Error in ingest listener: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker liveness and forwarding counters"""
+        return {
+            "mode": "processes",
+            "workers": self.workers,
+            "alive": sum(
+                1 for process in self._processes if process and process.is_alive()
+            ),
+            "restarts": self._restarts,
+            "subscription": self.topic,
+            "messages_forwarded": self._messages,
+            "rows_committed": self._rows,
+        }
@@ -0,0 +1,117 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from db_config import get_db_config
+from db_pool import pooled_connection
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("latest_values")
+
+
+class LatestValues:
+    """
+    Latest (value, timestamp) of every sensor, loaded once at startup and then
+    kept current by the ingest pipeline, committed writes and motor commands.
+
+    Updates carry the reading's timestamp and never move a sensor backwards
+    in time, so the same reading may safely arrive from more than one path
+    (e.g. when it is parsed and again when its batch is committed).
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or get_logger()
+        self._lock = threading.Lock()
+        self._values: Dict[int, Tuple[float, datetime]] = {}
+        self.loaded = False
+
+    def load(self, logger: Optional[logging.Logger] = None) -> bool:
+        """Rebuild the map from the newest stored reading of each sensor"""
+        logger = logger or self.logger
+        try:
+            with pooled_connection(get_db_config()) as conn:
+                cursor = conn.cursor()
+                # Both sides are served by the (sensor_id, timestamp) index
+                cursor.execute(
+                    """
+                    SELECT d.sensor_id, d.value, d.timestamp
+                    FROM sensor_data d
+                    JOIN (
+                        SELECT sensor_id, MAX(timestamp) AS latest
+                        FROM sensor_data
+                        GROUP BY sensor_id
+                    ) m ON d.sensor_id = m.sensor_id AND d.timestamp = m.latest
+                    ORDER BY d.id
+                    """
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error loading latest sensor values: {str(e)}")
+            return False
+
+        with self._lock:
+            # Rows sharing a timestamp come in ID order, so the last insert wins
+            for sensor_id, value, timestamp in rows:
+                current = self._values.get(sensor_id)
+                if current is None or timestamp >= current[1]:
+                    self._values[sensor_id] = (value, timestamp)
+            self.loaded = True
+
+        logger.info(f"Loaded latest values for {len(self._values)} sensors")
+        return True
+
+    def update(self, sensor_id: int, value: float, timestamp: datetime):
+        """Record a reading unless a newer one is already known"""
+        with self._lock:
+            current = self._values.get(sensor_id)
+            if current is None or timestamp >= current[1]:
+                self._values[sensor_id] = (value, timestamp)
+
+    def update_many(self, readings: Iterable[Tuple[int, float, datetime]]):
+        """Record several (sensor_id, value, timestamp) readings"""
+        with self._lock:
+            for sensor_id, value, timestamp in readings:
+                current = self._values.get(sensor_id)
+                if current is None or timestamp >= current[1]:
+                    self._values[sensor_id] = (value, timestamp)
+
+    def add_rows(self, rows: List[Tuple[Optional[int], int, float, datetime]]):
+        """Write listener for committed (id, sensor_id, value, timestamp) rows"""
+        self.update_many((row[1], row[2], row[3]) for row in rows)
+
+    def add_message(self, data: Dict[str, Any]):
+        """Ingest listener for a processed sensor message"""
+        timestamp = datetime.fromisoformat(data["timestamp"])
+        self.update_many(
+            (
+                reading["sensor_id"],
+                reading["value"],
+                (
+                    datetime.fromisoformat(reading["timestamp"])
+                    if "timestamp" in reading
+                    else timestamp
+                ),
+            )
+            for reading in data.get("readings", [])
+        )
+
+    def get(self, sensor_id: int) -> Optional[Tuple[float, datetime]]:
+        """Latest (value, timestamp) of a sensor, or None if it never reported"""
+        return self._values.get(sensor_id)
+
+    def snapshot(self) -> Dict[int, Tuple[float, datetime]]:
+        """Copy of the whole map"""
+        with self._lock:
+            return dict(self._values)
+
+
+# Shared map fed by every ingest path
+latest_values = LatestValues()
+
+
+def get_latest_values() -> LatestValues:
+    """Get the process-wide latest-value map"""
+    return latest_values
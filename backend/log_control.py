@@ -0,0 +1,140 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+
+class LogSampler:
+    """
+    Decides whether a per-message log line should be written: one message in
+    `sample_every`, and no more than `max_per_second` lines per second. The
+    number of suppressed lines is reported with the next line that is logged.
+    """
+
+    def __init__(self, sample_every: int = 100, max_per_second: float = 5.0):
+        self.sample_every = sample_every
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._count = 0
+        self._next_allowed = 0.0
+        self._suppressed = 0
+
+    def sample(self) -> Optional[int]:
+        """
+        Returns None if this message should not be logged, otherwise the
+        number of messages suppressed since the last one that was
+        """
+        with self._lock:
+            self._count += 1
+            now = time.monotonic()
+            if (self._count - 1) % self.sample_every or now < self._next_allowed:
+                self._suppressed += 1
+                return None
+            self._next_allowed = now + self.interval
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
+
+
+class VerboseTopics:
+    """
+    Topics whose messages are logged in full, switched on at runtime (see
+    /api/logging/topics) and switched off again after a time limit so
+    per-message logging can't be left on by accident.
+    """
+
+    def __init__(self):
+        self._until: Dict[str, float] = {}
+
+    def enable(self, topic: str, duration: float):
+        self._until[topic] = time.monotonic() + duration
+
+    def disable(self, topic: str):
+        self._until.pop(topic, None)
+
+    def is_verbose(self, topic: str) -> bool:
+        # Fast path: nothing is verbose, which is almost always the case
+        if not self._until:
+            return False
+        until = self._until.get(topic)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            self._until.pop(topic, None)
+            return False
+        return True
+
+    def active(self) -> Dict[str, float]:
+        """Verbose topics with the seconds left for each"""
+        now = time.monotonic()
+        return {
+            topic: round(until - now, 1)
+            for topic, until in list(self._until.items())
+            if until > now
+        }
+
+
+# Shared by the MQTT handler and the ingest path of this process; ingest
+# worker processes have their own, switched through IngestWorkerPool
+verbose_topics = VerboseTopics()
+
+
+def get_verbose_topics() -> VerboseTopics:
+    """Get the process-wide verbose topic switches"""
+    return verbose_topics
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record as it is. The stock prepare()
+    formats the message (and traceback) on the calling thread so the record
+    can be pickled; this queue never leaves the process, so all formatting
+    is left to the listener thread. Arguments are therefore read when the
+    record is written, not when it was logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def start_queue_logging() -> QueueListener:
+    """
+    Move the root logger's handlers behind a QueueHandler, so a log call only
+    enqueues the record and formatting and I/O happen on the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    log_queue: "queue.Queue[Any]" = queue.Queue(-1)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def stop_queue_logging():
+    """Flush queued records and put the original handlers back"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
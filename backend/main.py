@@ -8,24 +8,55 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect,
     Request,
+    Query,
+)
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    PlainTextResponse,
+    StreamingResponse,
 )
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles  # Import for serving static files
 
 from mqtt_client import MQTTHandler
 from sensor_data_access import (
-    get_complete_sensor_data,
+    decode_cursor,
     SensorData,
-    get_recent_readings,
-    update_relay_state,
-    get_all_sensors,
+    SensorHistory,
     get_latest_relay_state,
 )
+import async_data_access as async_db
+from async_data_access import QueryTimeoutError, get_db_executor
 from web_sockets import ConnectionManager
+from serialization import FastJSONResponse, dumps
+from response_cache import get_response_cache
+from static_assets import StaticAssets
+from db_pool import get_pool_stats, close_all_pools
+from sensor_registry import get_sensor_registry
+from ingest_pipeline import IngestPipeline
+from ingest_workers import IngestWorkerPool
+from spool import Spool, SpoolReplayer, open_spool
+from db_config import get_spool_config
+from rule_engine import RuleEngine, ThresholdRule
+from rollups import RESOLUTIONS
+from recent_readings import get_recent_buffer
+from latest_values import get_latest_values
+from sensor_data_processor import add_write_listener
+from migrations import apply_migrations
+from partitions import RetentionJob
+from metrics import (
+    DB_POOL_CONNECTIONS,
+    INGEST_QUEUE_DEPTH,
+    WEBSOCKET_CONNECTIONS,
+    WEBSOCKET_QUEUE_DEPTH,
+    HTTPMetricsMiddleware,
+    get_registry,
+)
+from tracing import get_tracer
+from log_control import get_verbose_topics, start_queue_logging, stop_queue_logging
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from pathlib import Path
 
@@ -38,9 +69,12 @@ logger = logging.getLogger("app")
 
 # Define the static files directory
 STATIC_DIR = Path(__file__).parent.parent / "frontend" / "dist"
+# Reload the in-memory copy of STATIC_DIR when the frontend is rebuilt
+STATIC_HOT_RELOAD = False
 
 # Create FastAPI app
-app = FastAPI(title="MQTT Listener")
+# Every JSON response is encoded with orjson (see serialization.py)
+app = FastAPI(title="MQTT Listener", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -49,9 +83,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
 
-# Mount the static files directory
-app.mount("/assets", StaticFiles(directory=f"{STATIC_DIR}/assets"), name="assets")
+# The built frontend, served from memory - loaded in startup event
+static_assets = StaticAssets(STATIC_DIR)
 
 # MQTT Configuration
 MQTT_BROKER = "192.168.62.88"
@@ -59,8 +94,31 @@ MQTT_PORT = 1883
 MQTT_TOPIC = "sensor/data"
 SENSOR_DATA_TOPIC = "sensors/data"
 
+# Write-behind ingest configuration for SENSOR_DATA_TOPIC
+INGEST_BATCH_SIZE = 500  # Flush after this many rows...
+INGEST_FLUSH_INTERVAL = 0.2  # ...or when the oldest pending row is this old (seconds)
+INGEST_QUEUE_SIZE = 10000  # Messages buffered between MQTT and the writer
+INGEST_OVERFLOW = "drop_oldest"  # "drop_oldest" or "block" when the queue is full
+# Worker processes sharing SENSOR_DATA_TOPIC through an MQTT shared subscription
+# ($share/<group>/<topic>, Mosquitto 1.6+); 0 ingests in this process
+INGEST_WORKERS = 0
+INGEST_SHARE_GROUP = "ingest"
+
+# End-to-end latency tracing: export this fraction of complete traces as JSON
+# lines to TRACE_EXPORT_PATH (None disables the export, not the percentiles)
+TRACE_EXPORT_PATH: Optional[str] = None
+TRACE_EXPORT_RATE = 0.01
+
+# Automatic motor control: start above / stop below, per sensor ID
+RELAY_SENSOR_ID = 4
+MOTOR_RULES = [
+    ThresholdRule(sensor_id=2, start_above=40.0, stop_below=30.0),  # Temperature
+]
+
 # Create connection manager for WebSockets
 manager = ConnectionManager()
+# Highest per-client update rate (Hz) a WebSocket client may ask for
+WS_MAX_RATE = 50.0
 
 # Global variable to store latest sensor data
 latest_sensor_data: Optional[Dict[str, Any]] = None
@@ -69,112 +127,74 @@ latest_sensor_data_lock = asyncio.Lock()
 # Create MQTT client - will be initialized in startup event
 mqtt_handler = None
 
-# Variables to track temperature-based motor control state
-motor_started_by_temperature = False
-last_temperature_reading = None
-last_motor_state = None
-
-
-# Function to handle temperature-based motor control
-async def handle_temperature_based_control(temperature, current_motor_state):
-    # Existing code remains unchanged
-    # ...
-    global motor_started_by_temperature, last_temperature_reading, last_motor_state
-
-    # Update tracking variables
-    last_temperature_reading = temperature
-    last_motor_state = current_motor_state
-
-    # Case 1: Temperature > 40°C - Start motor if not already running
-    if temperature > 40 and not current_motor_state:
-        logger.info(
-            f"Temperature ({temperature}°C) exceeds threshold of 40°C. Starting motor automatically."
-        )
+# Write-behind ingest pipeline - will be initialized in startup event
+ingest_pipeline: Optional[Union[IngestPipeline, IngestWorkerPool]] = None
 
-        # Update the relay state to 1 (on)
-        success = update_relay_state(1, logger)
-        if success:
-            motor_started_by_temperature = True
-
-            # Prepare data for WebSocket broadcast
-            timestamp = datetime.now().isoformat()
-            message = {
-                "timestamp": timestamp,
-                "readings": [
-                    {
-                        "sensor_id": 4,  # Relay sensor ID
-                        "sensor_name": "Relay Status",
-                        "value": 1,
-                    }
-                ],
-                "alert": {
-                    "type": "temperature_high",
-                    "message": f"Temperature ({temperature}°C) exceeded threshold of 40°C. Motor started automatically.",
-                    "temperature": temperature,
-                    "action": "motor_started",
-                },
-            }
+# Rule engine for automatic motor control - will be initialized in startup event
+rule_engine: Optional[RuleEngine] = None
 
-            # Broadcast to WebSocket clients
-            await manager.broadcast(message)
+# sensor_data partition and retention maintenance - started in startup event
+retention_job: Optional[RetentionJob] = None
 
-            # Also publish to MQTT
-            if mqtt_handler:
-                mqtt_handler.publish("motor/control", "start")
+# Local disk spool for rows the database can't take - opened in startup event
+# for the in-process pipeline (worker processes keep their own)
+spool: Optional[Spool] = None
+spool_replayer: Optional[SpoolReplayer] = None
 
-            logger.info("Motor started automatically due to high temperature")
-            return True
+# Event loop the app runs on, used to broadcast from the ingest thread
+app_loop: Optional[asyncio.AbstractEventLoop] = None
 
-    # Case 2: Temperature < 30°C - Stop motor only if it was started by temperature
-    elif temperature < 30 and current_motor_state and motor_started_by_temperature:
-        logger.info(
-            f"Temperature ({temperature}°C) fell below threshold of 30°C. Stopping motor automatically."
-        )
 
-        # Update the relay state to 0 (off)
-        success = update_relay_state(0, logger)
-        if success:
-            motor_started_by_temperature = False
-
-            # Prepare data for WebSocket broadcast
-            timestamp = datetime.now().isoformat()
-            message = {
-                "timestamp": timestamp,
-                "readings": [
-                    {
-                        "sensor_id": 4,  # Relay sensor ID
-                        "sensor_name": "Relay Status",
-                        "value": 0,
-                    }
-                ],
-                "alert": {
-                    "type": "temperature_normal",
-                    "message": f"Temperature ({temperature}°C) fell below threshold of 30°C. Motor stopped automatically.",
-                    "temperature": temperature,
-                    "action": "motor_stopped",
-                },
+# Carry out a rule engine decision (runs on the ingest worker thread, or the
+# forwarder thread with worker processes; neither may wait on the database)
+def apply_motor_rule(relay_state: int, alert: Dict[str, Any]) -> bool:
+    # Record the relay state: in-process, with the batch being written (and
+    # spooled with it if the database is down); otherwise on the executor
+    if isinstance(ingest_pipeline, IngestPipeline):
+        ingest_pipeline.add_rows([(RELAY_SENSOR_ID, relay_state, datetime.now())])
+    elif app_loop and app_loop.is_running():
+        asyncio.run_coroutine_threadsafe(_record_relay_state(relay_state), app_loop)
+    else:
+        return False
+
+    # Prepare data for WebSocket broadcast
+    message = {
+        "timestamp": datetime.now().isoformat(),
+        "readings": [
+            {
+                "sensor_id": RELAY_SENSOR_ID,
+                "sensor_name": "Relay Status",
+                "value": relay_state,
             }
+        ],
+        "alert": alert,
+    }
 
-            # Broadcast to WebSocket clients
-            await manager.broadcast(message)
+    # Broadcast to WebSocket clients
+    if app_loop and app_loop.is_running():
+        asyncio.run_coroutine_threadsafe(manager.broadcast(message), app_loop)
 
-            # Also publish to MQTT
-            if mqtt_handler:
-                mqtt_handler.publish("motor/control", "stop")
+    # Also publish to MQTT
+    command = "start" if relay_state == 1 else "stop"
+    if mqtt_handler:
+        mqtt_handler.publish("motor/control", command)
 
-            logger.info(
-                "Motor stopped automatically due to temperature returning to normal"
-            )
-            return True
+    logger.info(f"Motor {command} command issued by rule engine")
+    return True
 
-    return False
+
+async def _record_relay_state(relay_state: int):
+    try:
+        await async_db.update_relay_state(relay_state, logger)
+    except QueryTimeoutError as e:
+        logger.error(f"Relay state {relay_state} not recorded: {e}")
 
 
 # Function to update the latest sensor data (called from MQTT handler)
 def set_latest_sensor_data(data: Dict[str, Any]):
     global latest_sensor_data
     latest_sensor_data = data
-    logger.info("Latest sensor data updated")
+    logger.debug("Latest sensor data updated")
 
 
 # Setup startup and shutdown events
@@ -182,11 +202,44 @@ def set_latest_sensor_data(data: Dict[str, Any]):
 async def startup_event():
     # Existing code remains unchanged
     # ...
-    global mqtt_handler
+    global mqtt_handler, ingest_pipeline, rule_engine, retention_job, app_loop
+    global spool, spool_replayer
     # Get the current event loop
     loop = asyncio.get_running_loop()
+    app_loop = loop
     logger.info(f"App startup - Event loop: {loop}")
 
+    # Log records are formatted and written on a listener thread from here on
+    start_queue_logging()
+    if TRACE_EXPORT_PATH:
+        get_tracer().start_export(TRACE_EXPORT_PATH, TRACE_EXPORT_RATE)
+
+    # Read and precompress the SPA once; requests never touch the disk
+    static_assets.load()
+    if STATIC_HOT_RELOAD:
+        static_assets.start_watching()
+
+    # Bring the schema up to date before anything reads or writes it
+    apply_migrations(logger)
+
+    # Partition upkeep and retention run in the background; the first pass may
+    # rebuild sensor_data, so it must not hold up startup
+    retention_job = RetentionJob(logger=logger)
+    retention_job.start()
+
+    # Load the sensors table once so ingest never queries it per message
+    get_sensor_registry().load(logger)
+
+    # Seed the recent readings buffer and keep it current from every write
+    recent_buffer = get_recent_buffer()
+    recent_buffer.seed(logger)
+    add_write_listener(recent_buffer.add_rows)
+
+    # Latest value per sensor: rebuilt here, then fed by ingest and every write
+    latest_values = get_latest_values()
+    latest_values.load(logger)
+    add_write_listener(latest_values.add_rows)
+
     # Create MQTT handler
     mqtt_handler = MQTTHandler(
         broker=MQTT_BROKER,
@@ -198,11 +251,52 @@ async def startup_event():
     # Pass the event loop to MQTT handler
     mqtt_handler.set_event_loop(loop)
 
+    # Start the write-behind pipeline before any sensor message can arrive,
+    # either in this process or as a pool of worker processes
+    pipeline_options = {
+        "batch_size": INGEST_BATCH_SIZE,
+        "flush_interval": INGEST_FLUSH_INTERVAL,
+        "max_queue": INGEST_QUEUE_SIZE,
+        "overflow": INGEST_OVERFLOW,
+    }
+    if INGEST_WORKERS > 0:
+        ingest_pipeline = IngestWorkerPool(
+            INGEST_WORKERS,
+            MQTT_BROKER,
+            MQTT_PORT,
+            topic=SENSOR_DATA_TOPIC,
+            share_group=INGEST_SHARE_GROUP,
+            pipeline_options=pipeline_options,
+            logger=logger,
+        )
+    else:
+        # Rows the database can't take wait on local disk instead of being lost
+        if get_spool_config()["enabled"]:
+            spool, spool_replayer = open_spool(logger=logger)
+            spool_replayer.start()
+        ingest_pipeline = IngestPipeline(logger=logger, spool=spool, **pipeline_options)
+    # Evaluate motor rules once per message, seeded with the last stored relay state
+    rule_engine = RuleEngine(
+        MOTOR_RULES, apply_motor_rule, relay_sensor_id=RELAY_SENSOR_ID, logger=logger
+    )
+    rule_engine.set_relay_state(get_latest_relay_state(logger))
+    ingest_pipeline.add_listener(latest_values.add_message)
+    ingest_pipeline.add_listener(rule_engine.evaluate)
+    ingest_pipeline.add_listener(mqtt_handler.dispatch_sensor_data)
+    ingest_pipeline.start()
+
+    # Gauges are read from the components' own stats when /metrics is scraped
+    INGEST_QUEUE_DEPTH.set_callback(
+        lambda: ingest_pipeline.stats().get("queue_depth") if ingest_pipeline else None
+    )
+
     # Start MQTT client
     mqtt_handler.start()
     mqtt_handler.subscribe(MQTT_TOPIC)  # Subscribe to the main topic
-    mqtt_handler.subscribe(SENSOR_DATA_TOPIC)  # Subscribe to sensor data topic
-    logger.info(f"Subscribed to sensor data topic: {SENSOR_DATA_TOPIC}")
+    if isinstance(ingest_pipeline, IngestPipeline):
+        mqtt_handler.set_ingest_pipeline(ingest_pipeline)
+        mqtt_handler.subscribe(SENSOR_DATA_TOPIC)  # Subscribe to sensor data topic
+        logger.info(f"Subscribed to sensor data topic: {SENSOR_DATA_TOPIC}")
 
 
 @app.on_event("shutdown")
@@ -210,30 +304,58 @@ async def shutdown_event():
     global mqtt_handler
     if mqtt_handler:
         mqtt_handler.stop()
+    # Flush whatever the MQTT thread queued before it stopped
+    if ingest_pipeline:
+        ingest_pipeline.stop()
+    # Whatever the replayer hasn't drained stays on disk for the next start
+    if spool_replayer:
+        spool_replayer.stop()
+    if spool:
+        spool.close()
+    if retention_job:
+        retention_job.stop()
+    static_assets.stop()
+    get_db_executor().shutdown()
+    close_all_pools()
+    get_tracer().stop_export()
+    stop_queue_logging()
+
+
+@app.exception_handler(QueryTimeoutError)
+async def query_timeout_handler(request: Request, exc: QueryTimeoutError):
+    # The database is too slow right now; answer instead of holding the client
+    return FastJSONResponse(status_code=503, content={"error": str(exc)})
 
 
 # Dependency to ensure MQTT is connected
 def verify_mqtt_connection():
     if not mqtt_handler or not mqtt_handler.is_connected():
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=503, content={"error": "MQTT service unavailable"}
         )
     return True
 
 
 # Serve the SPA frontend ONLY at the root
-@app.get("/", response_class=HTMLResponse)
-async def serve_spa():
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def serve_spa(request: Request):
     """Serves the Single Page Application"""
-    index_path = STATIC_DIR / "index.html"
-    if not index_path.exists():
+    response = static_assets.response(request, "index.html")
+    if response is None:
         return HTMLResponse(
             content="Frontend not built. Run 'npm run build' in the frontend directory.",
             status_code=500,
         )
+    return response
+
 
-    with open(index_path) as f:
-        return HTMLResponse(content=f.read())
+@app.api_route("/assets/{path:path}", methods=["GET", "HEAD"])
+async def serve_asset(path: str, request: Request):
+    """Built JS/CSS bundles, precompressed and cached for a year when hashed"""
+    response = static_assets.response(request, f"assets/{path}")
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
 
 
 # API routes
@@ -253,6 +375,154 @@ async def get_mqtt_status():
     }
 
 
+def _websocket_queue_depth() -> Dict[Tuple[str, ...], float]:
+    stats = manager.stats()
+    return {
+        ("total",): stats["queue_depth_total"],
+        ("max",): stats["queue_depth_max"],
+    }
+
+
+def _db_pool_connections() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[Tuple[str, ...], float] = {}
+    for pool in get_pool_stats():
+        for state in ("open", "in_use", "idle"):
+            totals[(state,)] = totals.get((state,), 0) + pool[state]
+    return totals
+
+
+WEBSOCKET_QUEUE_DEPTH.set_callback(_websocket_queue_depth)
+WEBSOCKET_CONNECTIONS.set_callback(lambda: manager.stats()["connections"])
+DB_POOL_CONNECTIONS.set_callback(_db_pool_connections)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text-format metrics for ingest, database, WebSocket and HTTP
+    """
+    return PlainTextResponse(
+        get_registry().render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/api/db/pool")
+async def get_db_pool_stats():
+    """
+    Connection pool metrics: utilization, checkout wait time and reconnects
+    """
+    return {"pools": get_pool_stats()}
+
+
+@app.get("/api/db/retention")
+async def get_retention_stats():
+    """
+    Partitioning and retention settings and the outcome of the last maintenance run
+    """
+    if not retention_job:
+        return FastJSONResponse(
+            status_code=503, content={"error": "Retention job not running"}
+        )
+    return retention_job.stats()
+
+
+@app.get("/api/db/executor")
+async def get_db_executor_stats():
+    """
+    Thread-pool metrics for database calls made from async routes
+    """
+    return get_db_executor().stats()
+
+
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    """
+    Write-behind ingest queue depth, drops and rows written
+    """
+    if not ingest_pipeline:
+        raise HTTPException(status_code=503, detail="Ingest pipeline not initialized")
+    return ingest_pipeline.stats()
+
+
+@app.get("/api/ingest/spool")
+async def get_spool_stats():
+    """
+    Local ingest spool: backlog waiting for the database, replay progress and rows lost
+    """
+    if not spool_replayer:
+        raise HTTPException(status_code=503, detail="Ingest spool not enabled")
+    return spool_replayer.stats()
+
+
+@app.get("/api/traces/latency")
+async def get_trace_latency():
+    """
+    Latency percentiles per stage for recent sensors/data messages, measured
+    from MQTT receive: queue, parse, enqueue (broadcast queued), send (each
+    client), commit (DB) and total (last of them)
+    """
+    return get_tracer().stats()
+
+
+@app.get("/api/cache/stats")
+async def get_response_cache_stats():
+    """
+    Response cache entries, hits, rebuilds and 304 Not Modified answers
+    """
+    return get_response_cache().stats()
+
+
+@app.get("/api/static/stats")
+async def get_static_stats():
+    """
+    Frontend files held in memory, with their cache policy and variant sizes
+    """
+    return static_assets.stats()
+
+
+@app.get("/api/ws/stats")
+async def get_websocket_stats():
+    """
+    WebSocket fan-out metrics: connections, queue depths, drops and evictions
+    """
+    return manager.stats()
+
+
+@app.get("/api/logging/topics")
+async def get_verbose_log_topics():
+    """
+    Topics currently logging every message, with the seconds left for each
+    """
+    return {"verbose": get_verbose_topics().active()}
+
+
+@app.put("/api/logging/topics/{topic:path}")
+async def enable_verbose_log_topic(
+    topic: str, duration: float = Query(300, gt=0, le=3600)
+):
+    """
+    Log every message on one MQTT topic in full for `duration` seconds.
+    Other topics keep their sampled per-message logs.
+    """
+    get_verbose_topics().enable(topic, duration)
+    # With worker processes, sensors/data is received and parsed over there
+    if isinstance(ingest_pipeline, IngestWorkerPool):
+        ingest_pipeline.set_verbose(topic, duration)
+    logger.info(f"Verbose logging enabled for {topic} for {duration:g}s")
+    return {"status": "success", "verbose": get_verbose_topics().active()}
+
+
+@app.delete("/api/logging/topics/{topic:path}")
+async def disable_verbose_log_topic(topic: str):
+    """
+    Return a topic to sampled per-message logging
+    """
+    get_verbose_topics().disable(topic)
+    if isinstance(ingest_pipeline, IngestWorkerPool):
+        ingest_pipeline.set_verbose(topic, None)
+    return {"status": "success", "verbose": get_verbose_topics().active()}
+
+
 @app.get("/subscribe/{topic}")
 async def subscribe_to_topic(topic: str, _: bool = Depends(verify_mqtt_connection)):
     success = mqtt_handler.subscribe(topic)
@@ -262,128 +532,317 @@ async def subscribe_to_topic(topic: str, _: bool = Depends(verify_mqtt_connectio
         return {"status": "error", "message": "Failed to subscribe"}
 
 
+# Page size limits for /sensor/{sensor_id}
+READINGS_DEFAULT_LIMIT = 1000
+READINGS_MAX_LIMIT = 10000
+READINGS_STREAM_BATCH = 1000
+# Concurrent ndjson/csv exports; more are refused with a 503
+READINGS_MAX_STREAMS = 4
+_stream_slots = asyncio.Semaphore(READINGS_MAX_STREAMS)
+
+
+async def _stream_readings(
+    sensor_id: int,
+    fmt: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[Tuple[datetime, int]],
+) -> AsyncIterator[Union[str, bytes]]:
+    """Encode readings batch by batch as NDJSON or CSV while they are read"""
+    async with _stream_slots:
+        if fmt == "csv":
+            yield "id,timestamp,value\n"
+        try:
+            async for rows in async_db.iter_sensor_readings(
+                sensor_id, start, end, after, READINGS_STREAM_BATCH, logger
+            ):
+                if fmt == "csv":
+                    yield "".join(
+                        f"{reading_id},{timestamp.isoformat()},{value}\n"
+                        for reading_id, value, timestamp in rows
+                    )
+                else:
+                    yield b"".join(
+                        dumps(
+                            {"id": reading_id, "value": value, "timestamp": timestamp}
+                        )
+                        + b"\n"
+                        for reading_id, value, timestamp in rows
+                    )
+        except QueryTimeoutError as e:
+            # Headers are already sent; all that can be done is end the body
+            logger.error(f"Readings export for sensor {sensor_id} cut short: {e}")
+
+
 @app.get("/sensor/{sensor_id}", response_model=SensorData)
-async def get_sensor_data(sensor_id: int):
+async def get_sensor_data(
+    sensor_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(READINGS_DEFAULT_LIMIT, ge=1, le=READINGS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    format: str = "json",
+):
     """
-    Get all data for a specific sensor identified by its ID.
-    Returns sensor details and all readings with timestamps.
+    Get data for a specific sensor identified by its ID.
+    Returns sensor details and readings with timestamps, newest first.
+
+    - from / to: optional time bounds [from, to)
+    - limit / cursor: page size, and the next_cursor of the previous page
+    - format: json (one page), or ndjson / csv to stream every reading in range
     """
-    sensor_data = get_complete_sensor_data(sensor_id, logger)
+    if format not in ("json", "ndjson", "csv"):
+        raise HTTPException(
+            status_code=400, detail="Invalid format. Use 'json', 'ndjson' or 'csv'"
+        )
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format != "json":
+        if _stream_slots.locked():
+            raise HTTPException(
+                status_code=503, detail="Too many concurrent exports, retry later"
+            )
+        if not await async_db.get_sensor_by_id(sensor_id, logger):
+            raise HTTPException(
+                status_code=404, detail=f"Sensor with ID {sensor_id} not found"
+            )
+        media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            _stream_readings(sensor_id, format, start, end, after),
+            media_type=media_type,
+        )
+
+    sensor_data = await async_db.get_complete_sensor_data(
+        sensor_id, logger, start=start, end=end, limit=limit, after=after
+    )
 
     if not sensor_data:
         raise HTTPException(
             status_code=404, detail=f"Sensor with ID {sensor_id} not found"
         )
 
-    return sensor_data
+    # Returned as a response so the rows skip response_model validation
+    return FastJSONResponse(sensor_data)
+
+
+@app.get("/sensor/{sensor_id}/history", response_model=SensorHistory)
+async def get_sensor_history_data(
+    sensor_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    resolution: str = "auto",
+    max_points: int = Query(500, ge=1, le=10000),
+):
+    """
+    Get downsampled history for a sensor, served from the rollup tables.
+    Defaults to the last 24 hours; resolution is auto, raw, 1m, 1h or 1d.
+    """
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution. Use one of: auto, {', '.join(RESOLUTIONS)}",
+        )
+
+    end = end or datetime.now()
+    start = start or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+
+    history = await async_db.get_sensor_history(
+        sensor_id, start, end, resolution, max_points, logger
+    )
+
+    if not history:
+        raise HTTPException(
+            status_code=404, detail=f"Sensor with ID {sensor_id} not found"
+        )
+
+    return FastJSONResponse(history)
+
+
+# The ring buffer changes with every committed batch; serve its cached body
+# for this long (seconds) before rebuilding it
+RECENT_READINGS_MAX_AGE = 1.0
 
 
 @app.get("/api/recent_readings")
-async def get_init_readings():
+async def get_init_readings(request: Request):
     """
-    Get recent 50 readings for initializing the website
+    Get recent 50 readings for initializing the website.
+    Cached until the buffered readings change, for at least
+    RECENT_READINGS_MAX_AGE; supports If-None-Match / If-Modified-Since.
     """
-    readings = get_recent_readings(logger)
 
-    if not readings:
+    async def build():
+        readings = await async_db.get_recent_readings(logger)
+        if not readings:
+            return None
+        return {
+            "status": "success",
+            "message": "Recent readings retrieved successfully",
+            "data": readings,
+        }
+
+    cache = get_response_cache()
+    entry = await cache.get(
+        "recent_readings",
+        get_recent_buffer().revision,
+        build,
+        max_age=RECENT_READINGS_MAX_AGE,
+    )
+    if entry is None:
         raise HTTPException(status_code=404, detail=f"No readings found")
+    return cache.respond(request, entry)
 
-    return {
-        "status": "success",
-        "message": "Recent readings retrieved successfully",
-        "data": readings,
+
+@app.get("/api/latest")
+async def get_latest():
+    """
+    Current value of every sensor, from the in-memory latest-value map
+    """
+    sensors = {
+        sensor["id"]: sensor for sensor in await async_db.get_all_sensors(logger)
     }
+    latest = []
+    for sensor_id, (value, timestamp) in sorted(get_latest_values().snapshot().items()):
+        sensor = sensors.get(sensor_id, {})
+        latest.append(
+            {
+                "sensor_id": sensor_id,
+                "sensor_name": sensor.get("name"),
+                "sensor_type": sensor.get("type"),
+                "value": value,
+                "timestamp": timestamp.isoformat(),
+            }
+        )
+    return {"status": "success", "data": latest}
 
 
 @app.get("/api/get_sensors")
-async def get_sensors():
-    sensors = get_all_sensors(logger)
-    if not sensors:
-        return JSONResponse(content={"sensors": []}, status_code=200)
-    return sensors
+async def get_sensors(request: Request):
+    """
+    All sensors. Cached until the sensor registry changes; supports
+    If-None-Match / If-Modified-Since.
+    """
+
+    async def build():
+        sensors = await async_db.get_all_sensors(logger)
+        return sensors or {"sensors": []}
+
+    cache = get_response_cache()
+    entry = await cache.get("sensors", get_sensor_registry().generation, build)
+    return cache.respond(request, entry)
+
+
+@app.post("/api/sensors/refresh")
+async def refresh_sensors():
+    """
+    Invalidate the sensor registry after sensors were added or renamed
+    """
+    registry = get_sensor_registry()
+    registry.invalidate()
+    sensors = await async_db.get_all_sensors(logger)
+    return {"status": "success", "sensors": len(sensors)}
+
+
+async def _handle_subscription(websocket: WebSocket, message: Dict[str, Any]):
+    """
+    {"type": "subscribe", "sensor_ids": [2], "sensor_types": ["DHT22"]} limits
+    the client to those sensors ({"all": true} undoes it); "unsubscribe"
+    removes IDs or types. The client is sent its resulting subscription.
+    """
+    try:
+        sensor_ids = [int(sensor_id) for sensor_id in message.get("sensor_ids") or []]
+        sensor_types = [
+            str(sensor_type) for sensor_type in message.get("sensor_types") or []
+        ]
+    except (TypeError, ValueError):
+        await manager.send_personal_message(
+            {"type": "error", "message": "sensor_ids must be a list of integers"},
+            websocket,
+        )
+        return
+
+    if message["type"] == "subscribe":
+        subscription = manager.subscribe(
+            websocket, sensor_ids, sensor_types, all=bool(message.get("all"))
+        )
+    else:
+        subscription = manager.unsubscribe(websocket, sensor_ids, sensor_types)
+    if subscription is not None:
+        await manager.send_personal_message(
+            {"type": "subscription", **subscription}, websocket
+        )
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    max_rate: Optional[float] = Query(None, gt=0, le=WS_MAX_RATE),
+    minmax: bool = False,
+):
+    # Sensor data reaches the client only through the manager: every broadcast
+    # lands once in this client's send queue and wakes its writer task, so this
+    # coroutine just listens for client messages and sleeps while idle.
+    # /ws?max_rate=2 asks for conflated readings at most twice a second, and
+    # &minmax=true for the min/max of each window as well.
+    await manager.connect(websocket, max_rate=max_rate, include_range=minmax)
     logger.info(
         f"New WebSocket connection established. Total connections: {len(manager.active_connections)}"
     )
 
-    # Track data that's been sent to this specific client
-    last_sent_data = None
+    # Confirm the negotiated delivery policy
+    policy = manager.delivery_policy(websocket)
+    if policy is not None:
+        await manager.send_personal_message({"type": "delivery", **policy}, websocket)
+
+    # Give the new client the current readings straight away
+    if latest_sensor_data is not None:
+        await manager.send_personal_message(latest_sensor_data, websocket)
 
     # Set up heartbeat timeout detection
-    last_heartbeat = asyncio.get_running_loop().time()
+    loop = asyncio.get_running_loop()
+    last_heartbeat = loop.time()
     heartbeat_timeout = (
         300  # 5 minutes (300 seconds) to wait for heartbeat before closing connection
     )
 
     try:
         while True:
-            # Check for new sensor data
-            global latest_sensor_data
-
-            # Process and send new sensor data if available
-            if latest_sensor_data is not None and latest_sensor_data != last_sent_data:
-                # Check for temperature sensor data and handle temperature-based control
-                temperature_reading = None
-                current_motor_state = None
-
-                # Extract temperature and motor state if available
-                if "readings" in latest_sensor_data:
-                    for reading in latest_sensor_data["readings"]:
-                        if reading["sensor_id"] == 2:  # Temperature sensor
-                            temperature_reading = reading["value"]
-                        elif reading["sensor_id"] == 4:  # Relay status
-                            current_motor_state = reading["value"] == 1
-
-                # If we have temperature data, process it for motor control
-                if temperature_reading is not None:
-                    # Query current motor state if not included in the current data
-                    if current_motor_state is None:
-                        # Get the most recent relay state from the database
-                        current_motor_state = get_latest_relay_state(logger) == 1
-
-                    # Handle temperature-based control
-                    await handle_temperature_based_control(
-                        temperature_reading, current_motor_state
-                    )
-
-                await websocket.send_json(latest_sensor_data)
-                last_sent_data = latest_sensor_data
-                logger.debug("Sent new sensor data to client")
-
-            # Check if client heartbeat has timed out
-            current_time = asyncio.get_running_loop().time()
-            if current_time - last_heartbeat > heartbeat_timeout:
+            # Wait for the next client message, but no longer than the heartbeat allows
+            remaining = heartbeat_timeout - (loop.time() - last_heartbeat)
+            try:
+                data = await asyncio.wait_for(
+                    websocket.receive_text(), timeout=max(remaining, 0)
+                )
+            except asyncio.TimeoutError:
                 logger.info(
                     f"WebSocket client heartbeat timeout after {heartbeat_timeout}s, closing connection"
                 )
                 break  # Exit the loop to close the connection
 
-            # Listen for client messages with a reasonable timeout
-            try:
-                # Wait for client message - either data or a heartbeat
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=15.0)
-
-                # Process received message
-                if data:
-                    try:
-                        message = json.loads(data)
-                        # Check if this is a heartbeat from client
-                        if message.get("type") == "heartbeat":
-                            last_heartbeat = current_time
-                            # Optionally respond to heartbeat
-                            await websocket.send_json({"type": "heartbeat_ack"})
-                            logger.debug("Received heartbeat from client")
-                        # Handle other message types here if needed
-                    except json.JSONDecodeError:
-                        logger.warning("Received invalid JSON from WebSocket client")
-
-            except asyncio.TimeoutError:
-                # This timeout just means no message received yet - not an error
-                pass
+            # Process received message
+            if data:
+                try:
+                    message = json.loads(data)
+                    # Check if this is a heartbeat from client
+                    if message.get("type") == "heartbeat":
+                        last_heartbeat = loop.time()
+                        # Optionally respond to heartbeat
+                        await manager.send_personal_message(
+                            {"type": "heartbeat_ack"}, websocket
+                        )
+                        logger.debug("Received heartbeat from client")
+                    # Choose which sensors' readings this client receives
+                    elif message.get("type") in ("subscribe", "unsubscribe"):
+                        await _handle_subscription(websocket, message)
+                    # Handle other message types here if needed
+                except json.JSONDecodeError:
+                    logger.warning("Received invalid JSON from WebSocket client")
 
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected")
@@ -403,8 +862,6 @@ async def control_motor(command: str):
     Control motor by publishing to MQTT topic
     Command is received as a path parameter: /api/motor/control/start
     """
-    global motor_started_by_temperature
-
     logger.info(f"Motor control request received with command: {command}")
 
     if command not in ["start", "stop"]:
@@ -419,12 +876,17 @@ async def control_motor(command: str):
     # Map command to relay state (1 for start, 0 for stop)
     relay_state = 1 if command == "start" else 0
 
-    # If stopping manually, reset the temperature flag
-    if command == "stop":
-        motor_started_by_temperature = False
+    # Keep the latest-value map and the rule engine in step; a manual stop also
+    # overrides automatic control
+    get_latest_values().update(RELAY_SENSOR_ID, relay_state, datetime.now())
+    if rule_engine:
+        rule_engine.set_relay_state(relay_state, manual=True)
 
     # Update database with new relay state
-    db_updated = update_relay_state(relay_state, logger)
+    try:
+        db_updated = await async_db.update_relay_state(relay_state, logger)
+    except QueryTimeoutError:
+        db_updated = False
     if not db_updated:
         logger.warning(
             "Failed to update relay state in database, continuing with MQTT publish"
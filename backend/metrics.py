@@ -0,0 +1,294 @@
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds, 100 µs to 10 s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+
+class _Metric(ABC):
+    """
+    Base for metrics updated from hot paths without a shared lock.
+
+    Every thread writes to its own shard (a dict keyed by label values), so
+    an update is a thread-local lookup plus a dict write. The registry lock is
+    only taken the first time a thread touches the metric and when the
+    shards are summed for a scrape.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: Dict[Tuple[str, ...], Any] = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _format_labels(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(str(value))}"'
+            for name, value in zip(self.labelnames, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Sample lines in the text exposition format (the registry adds HELP/TYPE)"""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally per label values"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, labels: Tuple[str, ...] = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0.0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}_total{self._format_labels(labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values().items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies in seconds by default)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # Per-bucket counts (the last one is +Inf), then sum
+            state = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def render(self) -> List[str]:
+        merged: Dict[Tuple[str, ...], List[float]] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for labels, state in list(shard.items()):
+                total = merged.setdefault(labels, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+
+        lines = []
+        for labels, state in sorted(merged.items()):
+            cumulative = 0
+            bounds = list(self.buckets) + [math.inf]
+            for bound, count in zip(bounds, state[:-1]):
+                cumulative += count
+                le = 'le="' + ("+Inf" if math.isinf(bound) else repr(bound)) + '"'
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(labels, le)} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{self._format_labels(labels)} {_format_value(state[-1])}"
+            )
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Current value read at scrape time from a callback, which returns either a
+    number or a dict of label values to numbers
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Any]] = None,
+    ):
+        self.callback = callback
+        super().__init__(name, help, labelnames)
+
+    def set_callback(self, callback: Callable[[], Any]):
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        if self.callback is None:
+            return []
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [
+            f"{self.name}{self._format_labels(labels)} {_format_value(number)}"
+            for labels, number in items
+        ]
+
+
+class MetricsRegistry:
+    """All metrics of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Ingest
+MQTT_MESSAGES = Counter(
+    "mqtt_messages_received", "MQTT messages received, by topic", ["topic"]
+)
+PARSE_SECONDS = Histogram(
+    "sensor_parse_seconds", "Time to parse one sensor payload", ["format"]
+)
+SENSOR_LOOKUPS = Counter(
+    "sensor_id_lookups",
+    "Sensor name to ID lookups, by whether the registry already knew the name",
+    ["result"],
+)
+INSERT_ROWS = Counter(
+    "sensor_rows_inserted", "Rows committed to sensor_data, by outcome", ["outcome"]
+)
+COMMIT_SECONDS = Histogram(
+    "sensor_insert_commit_seconds",
+    "Time to insert and commit one batch of sensor_data rows with its rollups",
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth", "Messages waiting for the ingest writer"
+)
+
+# WebSocket fan-out
+BROADCAST_SECONDS = Histogram(
+    "websocket_broadcast_seconds",
+    "Time to serialize a broadcast and enqueue it for every client",
+)
+WEBSOCKET_QUEUE_DEPTH = Gauge(
+    "websocket_queue_depth",
+    "Messages waiting in WebSocket client send queues",
+    ["stat"],
+)
+WEBSOCKET_CONNECTIONS = Gauge("websocket_connections", "Connected WebSocket clients")
+
+# HTTP and database
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "HTTP request latency until the response starts, by route",
+    ["method", "route", "status"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Pooled database connections", ["state"]
+)
+
+
+class HTTPMetricsMiddleware:
+    """
+    ASGI middleware recording HTTP_REQUEST_SECONDS for every request, labelled
+    with the matched route template rather than the raw path so the number of
+    series stays bounded. Latency is measured until the response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                (scope["method"], path, str(status)),
+            )
+
+        async def send_wrapper(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not recorded:
+                record(500)
+            raise
+
+
+def get_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry"""
+    return registry
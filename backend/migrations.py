@@ -0,0 +1,145 @@
+import logging
+import sys
+from typing import Callable, List, NamedTuple, Optional, Union
+from db_config import get_db_config
+from db_pool import pooled_connection
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("migrations")
+
+
+class Migration(NamedTuple):
+    """
+    One schema change. `apply` is either a list of SQL statements or a
+    callable that receives an open cursor, for changes that first have to
+    inspect the current schema (MySQL has no CREATE INDEX IF NOT EXISTS).
+    """
+
+    version: int
+    description: str
+    apply: Union[List[str], Callable[..., None]]
+
+
+def _index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """,
+        (table, index),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _add_sensor_time_index(cursor):
+    # Serves every per-sensor read: WHERE sensor_id = ? ORDER BY timestamp.
+    # InnoDB appends the primary key to secondary indexes, so the
+    # (timestamp, id) keyset order is covered as well.
+    if not _index_exists(cursor, "sensor_data", "idx_sensor_data_sensor_time"):
+        cursor.execute(
+            "CREATE INDEX idx_sensor_data_sensor_time "
+            "ON sensor_data (sensor_id, timestamp)"
+        )
+
+
+def _rollup_table(table: str) -> str:
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            sensor_id INT NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            min_value DOUBLE NOT NULL,
+            max_value DOUBLE NOT NULL,
+            sum_value DOUBLE NOT NULL,
+            sample_count INT NOT NULL,
+            PRIMARY KEY (sensor_id, bucket_start),
+            FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+                ON DELETE CASCADE
+        )
+        """
+
+
+# Append-only: never edit or reorder a migration that has shipped
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1, "Add (sensor_id, timestamp) index to sensor_data", _add_sensor_time_index
+    ),
+    Migration(
+        2,
+        "Create rollup tables for databases installed before they existed",
+        [
+            _rollup_table(table)
+            for table in ("sensor_data_1m", "sensor_data_1h", "sensor_data_1d")
+        ],
+    ),
+]
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def apply_migrations(logger: Optional[logging.Logger] = None) -> bool:
+    """
+    Apply every migration newer than the recorded schema version, in order.
+
+    A named lock keeps several processes starting at once from racing each
+    other. MySQL commits DDL implicitly, so each migration is recorded right
+    after it succeeds and a failed run resumes from the failing migration.
+    """
+    logger = logger or get_logger()
+
+    try:
+        with pooled_connection(get_db_config()) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK('schema_migrations', 60)")
+            if cursor.fetchone()[0] != 1:
+                logger.error("Timed out waiting for the schema migration lock")
+                cursor.close()
+                return False
+
+            try:
+                _ensure_version_table(cursor)
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+
+                for migration in MIGRATIONS:
+                    if migration.version in applied:
+                        continue
+                    logger.info(
+                        f"Applying migration {migration.version}: {migration.description}"
+                    )
+                    if callable(migration.apply):
+                        migration.apply(cursor)
+                    else:
+                        for statement in migration.apply:
+                            cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description),
+                    )
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+                cursor.fetchall()
+                cursor.close()
+
+        logger.info(f"Database schema is at version {MIGRATIONS[-1].version}")
+        return True
+    except Exception as e:
+        logger.error(f"Error applying schema migrations: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # python migrations.py -- bring the database schema up to date
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if apply_migrations() else 1)
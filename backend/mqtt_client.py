@@ -1,9 +1,14 @@
 import logging
+import time
 import paho.mqtt.client as mqtt
 from threading import Thread
 import asyncio
 from typing import Optional, Callable, Dict, Any
 from sensor_data_processor import process_sensor_message
+from payload_parser import is_binary_payload
+from log_control import LogSampler, get_verbose_topics
+from metrics import MQTT_MESSAGES
+from tracing import current_trace
 
 
 class MQTTHandler:
@@ -35,11 +40,46 @@ class MQTTHandler:
         # Store the FastAPI app's event loop for proper coroutine execution
         self._app_loop = None
 
+        # Optional write-behind pipeline for the sensor data topic
+        self._ingest_pipeline = None
+
+        # Per-message logs are sampled unless a topic is made verbose at runtime
+        self._verbose_topics = get_verbose_topics()
+        self._message_sampler = LogSampler(sample_every=100, max_per_second=1.0)
+        self._drop_sampler = LogSampler(sample_every=1, max_per_second=1.0)
+        self._received = 0
+
     def set_event_loop(self, loop):
         """Set the FastAPI app's event loop for proper coroutine execution"""
         self._app_loop = loop
         self.logger.info("Event loop set for MQTT handler")
 
+    def set_ingest_pipeline(self, pipeline):
+        """Hand sensor data messages to a write-behind ingest pipeline"""
+        self._ingest_pipeline = pipeline
+        self.logger.info("Ingest pipeline set for MQTT handler")
+
+    def dispatch_sensor_data(self, processed_data):
+        """Publish processed sensor data to the app and its WebSocket clients"""
+        # Import here to avoid circular import
+        from main import set_latest_sensor_data, manager
+
+        # Set the latest sensor data
+        set_latest_sensor_data(processed_data)
+
+        # Ensure we have an event loop and schedule the broadcast
+        if self._app_loop and self._app_loop.is_running():
+            trace = current_trace()
+            if trace:
+                # Keep the trace open until the broadcast has been queued
+                trace.expect(1)
+            asyncio.run_coroutine_threadsafe(
+                manager.broadcast(processed_data, trace), self._app_loop
+            )
+            self.logger.debug("WebSocket broadcast scheduled")
+        else:
+            self.logger.error("No event loop available for WebSocket broadcast")
+
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.logger.info(f"Connected to MQTT Broker at {self.broker}:{self.port}")
@@ -51,33 +91,50 @@ class MQTTHandler:
             self.logger.error(f"Failed to connect to MQTT broker with code: {rc}")
 
     def _on_message(self, client, userdata, msg):
+        # Start of the end-to-end latency trace (see tracing.py)
+        received = time.monotonic()
         topic = msg.topic
-        payload = msg.payload.decode()
-        self.logger.info(f"Received message on {topic}: {payload}")
+        self._received += 1
+        MQTT_MESSAGES.inc(labels=(topic,))
+
+        # Binary sensor payloads are handed on as raw bytes, everything else as text
+        if topic == "sensors/data" and is_binary_payload(msg.payload):
+            payload = msg.payload
+        else:
+            payload = msg.payload.decode(errors="replace")
+
+        if self._verbose_topics.is_verbose(topic):
+            self.logger.info("Received message on %s: %r", topic, payload)
+        else:
+            suppressed = self._message_sampler.sample()
+            if suppressed is not None:
+                self.logger.info(
+                    "Received %d-byte message on %s (%d messages received, "
+                    "%d not logged since the last line)",
+                    len(msg.payload),
+                    topic,
+                    self._received,
+                    suppressed,
+                )
 
         # Special handling for sensor data topic
         if topic == "sensors/data":
-            self.logger.info("Processing sensor data message")
-
-            # Direct processing for immediate action
-            processed_data = process_sensor_message(payload, self.logger)
-            if processed_data:
-                # Import here to avoid circular import
-                from main import set_latest_sensor_data, manager
-
-                # Set the latest sensor data
-                set_latest_sensor_data(processed_data)
-
-                # Ensure we have an event loop and schedule the broadcast
-                if self._app_loop and self._app_loop.is_running():
-                    asyncio.run_coroutine_threadsafe(
-                        manager.broadcast(processed_data), self._app_loop
-                    )
-                    self.logger.info(
-                        "WebSocket broadcast scheduled via run_coroutine_threadsafe"
-                    )
-                else:
-                    self.logger.error("No event loop available for WebSocket broadcast")
+            if self._ingest_pipeline:
+                # Queue for the background writer; never block on the database here
+                if not self._ingest_pipeline.submit(payload, received):
+                    suppressed = self._drop_sampler.sample()
+                    if suppressed is not None:
+                        self.logger.warning(
+                            "Ingest queue full, sensor message dropped "
+                            "(%d more dropped since the last warning)",
+                            suppressed,
+                        )
+            else:
+
+                # Direct processing for immediate action
+                processed_data = process_sensor_message(payload, self.logger)
+                if processed_data:
+                    self.dispatch_sensor_data(processed_data)
 
         # Call any registered handlers for this topic
         if topic in self.subscriptions and self.subscriptions[topic]:
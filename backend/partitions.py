@@ -0,0 +1,317 @@
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta
+from threading import Thread
+from typing import Any, Dict, List, Optional, Tuple
+from db_config import get_db_config, get_retention_config
+from db_pool import pooled_connection
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("partitions")
+
+
+# Catch-all partition that always stays last, so an insert never fails for
+# lack of a partition even if maintenance stops running
+MAXVALUE_PARTITION = "pmax"
+
+
+def _month_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(month: datetime) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_clause(month: datetime) -> str:
+    # Partition pYYYYMM holds the rows of that month
+    return (
+        f"PARTITION {_partition_name(month)} "
+        f"VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))"
+    )
+
+
+def get_partitions(cursor, table: str = "sensor_data") -> List[Tuple[str, str]]:
+    """(name, upper bound) of every partition of `table`, in order"""
+    cursor.execute(
+        """
+        SELECT partition_name, partition_description
+        FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s
+              AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+        """,
+        (table,),
+    )
+    return [(name, bound) for name, bound in cursor.fetchall()]
+
+
+def partition_table(cursor, months_ahead: int, logger: logging.Logger):
+    """
+    Convert sensor_data to monthly RANGE partitions on TO_DAYS(timestamp).
+
+    MySQL requires the partitioning column in every unique key and does not
+    support foreign keys on partitioned tables, so the primary key becomes
+    (id, timestamp) and the sensors foreign key is dropped. This rebuilds the
+    table once; run it in a maintenance window on large installations.
+    """
+    cursor.execute(
+        """
+        SELECT constraint_name FROM information_schema.referential_constraints
+        WHERE constraint_schema = DATABASE() AND table_name = 'sensor_data'
+        """
+    )
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE sensor_data DROP FOREIGN KEY {constraint}")
+
+    cursor.execute("SELECT MIN(timestamp) FROM sensor_data")
+    oldest = cursor.fetchone()[0] or datetime.now()
+
+    month = _month_start(oldest)
+    last = _month_start(datetime.now())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+
+    clauses = []
+    while month <= last:
+        clauses.append(_partition_clause(month))
+        month = _next_month(month)
+    clauses.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+
+    logger.info(f"Partitioning sensor_data into {len(clauses)} partitions")
+    cursor.execute(
+        f"""
+        ALTER TABLE sensor_data
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, timestamp)
+        PARTITION BY RANGE (TO_DAYS(timestamp)) (
+            {", ".join(clauses)}
+        )
+        """
+    )
+
+
+def ensure_future_partitions(cursor, months_ahead: int, logger: logging.Logger):
+    """Split empty monthly partitions off pmax up to `months_ahead` months out"""
+    names = [name for name, _ in get_partitions(cursor) if name != MAXVALUE_PARTITION]
+    target = _month_start(datetime.now())
+    for _ in range(months_ahead):
+        target = _next_month(target)
+
+    month = _next_month(datetime.strptime(names[-1], "p%Y%m")) if names else target
+    while month <= target:
+        logger.info(f"Adding partition {_partition_name(month)}")
+        cursor.execute(
+            f"""
+            ALTER TABLE sensor_data REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO (
+                {_partition_clause(month)},
+                PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE
+            )
+            """
+        )
+        month = _next_month(month)
+
+
+def expire_partitions(
+    cursor, cutoff: datetime, archive: bool, logger: logging.Logger
+) -> List[str]:
+    """
+    Drop every partition whose rows are all older than `cutoff`. With
+    `archive`, a partition is first swapped into its own sensor_data_archive_*
+    table, which is a metadata-only operation like the drop itself.
+    """
+    cursor.execute("SELECT TO_DAYS(%s)", (cutoff,))
+    cutoff_days = cursor.fetchone()[0]
+
+    expired = []
+    for name, bound in get_partitions(cursor):
+        if name == MAXVALUE_PARTITION or int(bound) > cutoff_days:
+            continue
+
+        if archive:
+            cursor.execute(f"SELECT 1 FROM sensor_data PARTITION ({name}) LIMIT 1")
+            if cursor.fetchall():
+                table = f"sensor_data_archive_{name}"
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} LIKE sensor_data")
+                cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+                if cursor.fetchall():
+                    # EXCHANGE needs an empty table; don't swap old rows back in
+                    logger.error(f"Archive table {table} is not empty, skipping {name}")
+                    continue
+                # LIKE copies the partitioning, but a table created before
+                # sensor_data was partitioned has none, and removing it fails
+                if get_partitions(cursor, table):
+                    cursor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+                cursor.execute(
+                    f"ALTER TABLE sensor_data EXCHANGE PARTITION {name} WITH TABLE {table}"
+                )
+                logger.info(f"Archived partition {name} to {table}")
+
+        cursor.execute(f"ALTER TABLE sensor_data DROP PARTITION {name}")
+        logger.info(f"Dropped partition {name}")
+        expired.append(name)
+    return expired
+
+
+def expire_rows(conn, cutoff: datetime, archive: bool, batch_size: int = 10000) -> int:
+    """
+    Delete (or move to sensor_data_archive) readings older than `cutoff` from
+    an unpartitioned table, in small transactions so ingest is never blocked
+    for long. Returns the number of rows removed.
+    """
+    cursor = conn.cursor()
+    if archive:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS sensor_data_archive LIKE sensor_data"
+        )
+
+    removed = 0
+    while True:
+        cursor.execute(
+            """
+            SELECT MAX(id) FROM (
+                SELECT id FROM sensor_data
+                WHERE timestamp < %s
+                ORDER BY id
+                LIMIT %s
+            ) expired
+            """,
+            (cutoff, batch_size),
+        )
+        last_id = cursor.fetchone()[0]
+        if last_id is None:
+            break
+
+        conn.start_transaction()
+        try:
+            if archive:
+                cursor.execute(
+                    """
+                    INSERT INTO sensor_data_archive
+                    SELECT * FROM sensor_data WHERE id <= %s AND timestamp < %s
+                    """,
+                    (last_id, cutoff),
+                )
+            cursor.execute(
+                "DELETE FROM sensor_data WHERE id <= %s AND timestamp < %s",
+                (last_id, cutoff),
+            )
+            removed += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    cursor.close()
+    return removed
+
+
+def run_maintenance(
+    config: Optional[Dict[str, Any]] = None, logger: Optional[logging.Logger] = None
+) -> Dict[str, Any]:
+    """
+    One maintenance pass: partition the table if configured, keep future
+    partitions ready and expire raw readings past the retention period.
+    Rollup tables are never expired, so downsampled history outlives the raw
+    readings.
+    """
+    config = config or get_retention_config()
+    logger = logger or get_logger()
+    summary: Dict[str, Any] = {
+        "partitioned": False,
+        "expired_partitions": [],
+        "expired_rows": 0,
+    }
+
+    with pooled_connection(get_db_config()) as conn:
+        cursor = conn.cursor()
+        partitioned = bool(get_partitions(cursor))
+        if config["partitioning"] and not partitioned:
+            partition_table(cursor, config["months_ahead"], logger)
+            partitioned = True
+        if partitioned:
+            ensure_future_partitions(cursor, config["months_ahead"], logger)
+        summary["partitioned"] = partitioned
+
+        if config["retention_days"]:
+            cutoff = datetime.now() - timedelta(days=config["retention_days"])
+            if partitioned:
+                summary["expired_partitions"] = expire_partitions(
+                    cursor, cutoff, config["archive"], logger
+                )
+            else:
+                summary["expired_rows"] = expire_rows(conn, cutoff, config["archive"])
+                if summary["expired_rows"]:
+                    logger.info(
+                        f"Expired {summary['expired_rows']} readings older than {cutoff}"
+                    )
+        cursor.close()
+
+    return summary
+
+
+class RetentionJob:
+    """Background thread that runs run_maintenance() every `interval` seconds"""
+
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.config = config or get_retention_config()
+        self.logger = logger or get_logger()
+        self._stop = threading.Event()
+        self._thread: Optional[Thread] = None
+        self.last_run: Optional[datetime] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="retention-job")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_result = run_maintenance(self.config, self.logger)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                self.logger.error(f"Error running sensor_data maintenance: {str(e)}")
+            self.last_run = datetime.now()
+            self._stop.wait(self.config["interval"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "config": self.config,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    # python partitions.py -- run one partition/retention maintenance pass
+    logging.basicConfig(level=logging.INFO)
+    try:
+        print(run_maintenance())
+    except Exception as e:
+        get_logger().error(f"Maintenance failed: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,204 @@
+import json
+import math
+import re
+import struct
+from datetime import datetime
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+
+class ParseResult(NamedTuple):
+    readings: List[Tuple[str, float]]  # (sensor_name, value)
+    errors: List[str]  # Malformed fragments, reported instead of raised
+    # (sensor_id, value, device_timestamp) from the binary format
+    id_readings: Sequence[Tuple[int, float, Optional[datetime]]] = ()
+
+
+# Binary wire format:
+#   header  magic 0xB5, version 1, flags (bit 0: records carry a timestamp)
+#   records little-endian uint16 sensor_id, float32 value
+#           [, uint32 device timestamp in Unix seconds]
+# The magic byte is not valid as the first byte of UTF-8 text, so the format
+# can be told apart from the text and JSON payloads by its first byte alone.
+BINARY_MAGIC = 0xB5
+BINARY_VERSION = 1
+BINARY_FLAG_TIMESTAMP = 0x01
+_BINARY_HEADER = struct.Struct("<BBB")
+_BINARY_RECORD = struct.Struct("<Hf")
+_BINARY_RECORD_TS = struct.Struct("<HfI")
+
+
+# One comma-separated fragment: either "Name: value" (groups 1 and 2) or, if
+# that doesn't match, the whole malformed fragment (group 3). The value accepts
+# a sign, a leading or trailing decimal point and an exponent; anything after it
+# up to the next comma (units, stray characters) is ignored like the original
+# parser did. The name is matched greedily up to its last non-space character
+# so the engine never backtracks over it character by character.
+_TEXT_FRAGMENT = re.compile(
+    r"\s*(?:([^:,]*[^:,\s])\s*:\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)[^,]*"
+    r"|([^,]*))(?:,|\Z)"
+)
+
+
+def parse_text_payload(message: str) -> ParseResult:
+    """
+    Parse "Current Sensor 1: 25.467, Temperature Sensor 1: 30.456" in one scan.
+    findall() walks the message once in C and hands back every fragment, so no
+    intermediate list of split and stripped parts is built.
+    """
+    readings: List[Tuple[str, float]] = []
+    errors: List[str] = []
+
+    for name, value, malformed in _TEXT_FRAGMENT.findall(message):
+        if name:
+            number = float(value)
+            # An exponent like 1e999 overflows to inf, which MySQL can't store
+            if math.isfinite(number):
+                readings.append((name, number))
+            else:
+                errors.append(f"{name}: {value}")
+        elif malformed and not malformed.isspace():
+            errors.append(malformed.strip())
+
+    return ParseResult(readings, errors)
+
+
+def _json_reading(name: Any, value: Any, readings: List[Tuple[str, float]], errors):
+    number = None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            number = float(value)
+        except OverflowError:  # an integer literal too large for a double
+            pass
+    # json.loads also accepts NaN and Infinity, which MySQL can't store
+    if isinstance(name, str) and name and number is not None and math.isfinite(number):
+        readings.append((name, number))
+    else:
+        errors.append(f"{name}: {value}")
+
+
+def parse_json_payload(message: Union[str, bytes]) -> ParseResult:
+    """
+    Parse the compact JSON variant of the payload. Accepted shapes:
+    {"Current Sensor 1": 25.467, ...} or
+    [{"name": "Current Sensor 1", "value": 25.467}, ...]
+    """
+    readings: List[Tuple[str, float]] = []
+    errors: List[str] = []
+
+    try:
+        data = json.loads(message)
+    except ValueError as e:
+        return ParseResult(readings, [f"invalid JSON: {str(e)}"])
+
+    if isinstance(data, dict):
+        for name, value in data.items():
+            _json_reading(name, value, readings, errors)
+    elif isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                _json_reading(
+                    item.get("name", item.get("sensor_name")),
+                    item.get("value"),
+                    readings,
+                    errors,
+                )
+            else:
+                errors.append(str(item))
+    else:
+        errors.append(str(data))
+
+    return ParseResult(readings, errors)
+
+
+def is_binary_payload(payload: Union[str, bytes, bytearray, memoryview]) -> bool:
+    """True if the payload uses the binary wire format"""
+    return (
+        not isinstance(payload, str) and len(payload) > 0 and payload[0] == BINARY_MAGIC
+    )
+
+
+def parse_binary_payload(payload: Union[bytes, bytearray, memoryview]) -> ParseResult:
+    """
+    Decode packed binary records. Records are unpacked straight from a
+    memoryview of the MQTT payload, so the buffer is never copied.
+    """
+    view = memoryview(payload)
+    errors: List[str] = []
+
+    if len(view) < _BINARY_HEADER.size:
+        return ParseResult([], ["truncated binary header"])
+
+    _, version, flags = _BINARY_HEADER.unpack_from(view)
+    if version != BINARY_VERSION:
+        return ParseResult([], [f"unsupported binary payload version {version}"])
+
+    body = view[_BINARY_HEADER.size :]
+    record = _BINARY_RECORD_TS if flags & BINARY_FLAG_TIMESTAMP else _BINARY_RECORD
+    extra = len(body) % record.size
+    if extra:
+        errors.append(f"{extra} trailing bytes after last complete record")
+        body = body[: len(body) - extra]
+
+    # float32 can carry NaN and infinity bit patterns, which MySQL can't store
+    isfinite = math.isfinite
+    if record is _BINARY_RECORD:
+        id_readings = [
+            (sensor_id, value, None)
+            for sensor_id, value in record.iter_unpack(body)
+            if isfinite(value)
+        ]
+    else:
+        fromtimestamp = datetime.fromtimestamp
+        id_readings = [
+            (sensor_id, value, fromtimestamp(ts) if ts else None)
+            for sensor_id, value, ts in record.iter_unpack(body)
+            if isfinite(value)
+        ]
+    if len(id_readings) < len(body) // record.size:
+        errors.extend(
+            f"sensor {fields[0]}: {fields[1]}"
+            for fields in record.iter_unpack(body)
+            if not isfinite(fields[1])
+        )
+
+    return ParseResult([], errors, id_readings)
+
+
+def encode_binary_payload(
+    readings: Iterable[Tuple[int, float]], timestamp: Optional[datetime] = None
+) -> bytes:
+    """
+    Build a binary payload from (sensor_id, value) pairs, as a device would.
+    When a timestamp is given it is attached to every record.
+    """
+    if timestamp is None:
+        header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0)
+        return header + b"".join(
+            _BINARY_RECORD.pack(sensor_id, value) for sensor_id, value in readings
+        )
+
+    ts = int(timestamp.timestamp())
+    header = _BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_FLAG_TIMESTAMP)
+    return header + b"".join(
+        _BINARY_RECORD_TS.pack(sensor_id, value, ts) for sensor_id, value in readings
+    )
+
+
+def parse_payload(payload: Union[str, bytes, bytearray, memoryview]) -> ParseResult:
+    """
+    Parse a sensors/data payload in any supported format.
+    Binary is detected by its magic byte, JSON by a leading "{" or "[";
+    everything else is the text format.
+    """
+    if not isinstance(payload, str):
+        if is_binary_payload(payload):
+            return parse_binary_payload(payload)
+        try:
+            payload = bytes(payload).decode("utf-8")
+        except UnicodeDecodeError:
+            return ParseResult([], ["payload is not valid UTF-8"])
+
+    stripped = payload.lstrip()
+    if stripped[:1] in ("{", "["):
+        return parse_json_payload(stripped)
+    return parse_text_payload(payload)
@@ -0,0 +1,136 @@
+import logging
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from db_config import get_db_config
+from db_pool import pooled_connection
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("recent_readings")
+
+
+def _timestamp(reading: Tuple[Optional[int], float, datetime]) -> datetime:
+    return reading[2]
+
+
+class RecentReadingsBuffer:
+    """
+    Fixed-size ring buffer of the most recent readings for every sensor.
+
+    Seeded once with a single windowed query and then kept current by the
+    ingest path (see sensor_data_processor.add_write_listener), so serving
+    the dashboard's initial data needs no database queries at all.
+    `revision` changes whenever the buffered readings do, so responses built
+    from a snapshot can be cached against it.
+    """
+
+    def __init__(self, size: int = 50, logger: Optional[logging.Logger] = None):
+        self.size = size
+        self.logger = logger or get_logger()
+        self._lock = threading.Lock()
+        self._buffers: Dict[int, Deque[Tuple[Optional[int], float, datetime]]] = {}
+        self.seeded = False
+        self.revision = 0
+
+    def seed(self, logger: Optional[logging.Logger] = None) -> bool:
+        """Load the newest `size` readings per sensor in one query"""
+        logger = logger or self.logger
+        try:
+            with pooled_connection(get_db_config()) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT id, sensor_id, value, timestamp
+                    FROM (
+                        SELECT id, sensor_id, value, timestamp,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY sensor_id
+                                   ORDER BY timestamp DESC, id DESC
+                               ) AS position
+                        FROM sensor_data
+                    ) ranked
+                    WHERE position <= %s
+                    ORDER BY sensor_id, timestamp, id
+                    """,
+                    (self.size,),
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error seeding recent readings: {str(e)}")
+            return False
+
+        buffers: Dict[int, Deque[Tuple[Optional[int], float, datetime]]] = {}
+        for reading_id, sensor_id, value, timestamp in rows:
+            buffer = buffers.get(sensor_id)
+            if buffer is None:
+                buffer = buffers[sensor_id] = deque(maxlen=self.size)
+            buffer.append((reading_id, value, timestamp))
+
+        with self._lock:
+            self._buffers = buffers
+            self.seeded = True
+            self.revision += 1
+
+        logger.info(f"Seeded recent readings for {len(buffers)} sensors")
+        return True
+
+    def add_rows(self, rows: List[Tuple[Optional[int], int, float, datetime]]):
+        """
+        Add committed (id, sensor_id, value, timestamp) rows. Rows usually
+        arrive newest last, but replayed spool rows and device timestamps can
+        be older than what is buffered, so those are put in timestamp order
+        (or skipped if older than a full buffer's oldest reading).
+        """
+        with self._lock:
+            changed = False
+            for reading_id, sensor_id, value, timestamp in rows:
+                buffer = self._buffers.get(sensor_id)
+                if buffer is None:
+                    buffer = self._buffers[sensor_id] = deque(maxlen=self.size)
+                if not buffer or timestamp >= buffer[-1][2]:
+                    buffer.append((reading_id, value, timestamp))
+                    changed = True
+                    continue
+                if len(buffer) == self.size:
+                    if timestamp < buffer[0][2]:
+                        continue
+                    buffer.popleft()
+                position = bisect_right(buffer, timestamp, key=_timestamp)
+                buffer.insert(position, (reading_id, value, timestamp))
+                changed = True
+            if changed:
+                self.revision += 1
+
+    def snapshot(self) -> Dict[int, List[Dict[str, Any]]]:
+        """Readings per sensor, newest first, in the shape the API returns"""
+        with self._lock:
+            copies = {
+                sensor_id: list(buffer) for sensor_id, buffer in self._buffers.items()
+            }
+
+        return {
+            sensor_id: [
+                {
+                    "id": reading_id,
+                    "sensor_id": sensor_id,
+                    "value": value,
+                    "timestamp": timestamp,
+                }
+                for reading_id, value, timestamp in reversed(readings)
+            ]
+            for sensor_id, readings in copies.items()
+        }
+
+
+# Shared buffer fed by every write to sensor_data
+recent_readings = RecentReadingsBuffer()
+
+
+def get_recent_buffer() -> RecentReadingsBuffer:
+    """Get the process-wide recent readings buffer"""
+    return recent_readings
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+from fastapi import Request, Response
+from serialization import dumps
+
+
+class CachedResponse(NamedTuple):
+    version: int
+    body: bytes
+    etag: str
+    # Epoch seconds the body last changed, and the same as an HTTP date
+    modified: float
+    last_modified: str
+    # time.monotonic() the content was read at
+    built: float
+
+
+class ResponseCache:
+    """
+    Encoded JSON bodies of read endpoints, each valid for one version of its
+    data. A request for the current version is answered from memory, with a
+    304 if the client's If-None-Match / If-Modified-Since still matches.
+    Data that changes several times a second can be served up to `max_age`
+    seconds stale instead, so polls between changes still hit the cache.
+
+    Only one rebuild per key runs at a time: requests arriving while it runs
+    wait for its result, so a burst of reconnecting dashboards costs a
+    single query. ETags are a hash of the body, so a version bump that didn't
+    change the content (or a restart) keeps clients' copies valid.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, CachedResponse] = {}
+        self._building: Dict[str, "asyncio.Task[Optional[CachedResponse]]"] = {}
+        self._building_version: Dict[str, int] = {}
+
+        # Counters
+        self._hits = 0
+        self._builds = 0
+        self._shared = 0
+        self._not_modified = 0
+
+    async def get(
+        self,
+        key: str,
+        version: int,
+        build: Callable[[], Awaitable[Any]],
+        max_age: float = 0.0,
+    ) -> Optional[CachedResponse]:
+        """
+        Cached response for `key` at `version`, or at an older version if that
+        was built less than `max_age` seconds ago, calling `build` for the
+        content if there is none. Returns None (and caches nothing) when
+        `build` returns None.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and (
+            entry.version >= version or time.monotonic() - entry.built < max_age
+        ):
+            self._hits += 1
+            return entry
+
+        task = self._building.get(key)
+        if task is not None and self._building_version[key] >= version:
+            self._shared += 1
+        else:
+            self._builds += 1
+            task = asyncio.create_task(self._build(key, version, build))
+            self._building[key] = task
+            self._building_version[key] = version
+        # A cancelled request must not cancel the build others are waiting for
+        return await asyncio.shield(task)
+
+    async def _build(
+        self, key: str, version: int, build: Callable[[], Awaitable[Any]]
+    ) -> Optional[CachedResponse]:
+        try:
+            built = time.monotonic()
+            content = await build()
+            if content is None:
+                return None
+
+            body = dumps(content)
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+            previous = self._entries.get(key)
+            if previous is not None and previous.etag == etag:
+                modified = previous.modified
+            else:
+                modified = time.time()
+            entry = CachedResponse(
+                version, body, etag, modified, formatdate(modified, usegmt=True), built
+            )
+            if previous is None or previous.version <= version:
+                self._entries[key] = entry
+            return entry
+        finally:
+            if self._building.get(key) is asyncio.current_task():
+                del self._building[key]
+                del self._building_version[key]
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        """200 with the cached body, or 304 if the client's copy is current"""
+        headers = {
+            "ETag": entry.etag,
+            "Last-Modified": entry.last_modified,
+            # Clients may keep the body but must revalidate before using it
+            "Cache-Control": "no-cache",
+        }
+        if _not_modified(request, entry):
+            self._not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry versions and hit, rebuild and 304 counters"""
+        return {
+            "entries": {
+                key: {"version": entry.version, "bytes": len(entry.body)}
+                for key, entry in self._entries.items()
+            },
+            "hits": self._hits,
+            "builds": self._builds,
+            "shared_builds": self._shared,
+            "not_modified": self._not_modified,
+        }
+
+
+def _not_modified(request: Request, entry: CachedResponse) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.1.3)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: a W/ prefix added by a proxy still matches
+        return "*" in tags or any(tag.removeprefix("W/") == entry.etag for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(entry.modified) <= since
+    return False
+
+
+response_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache"""
+    return response_cache
@@ -0,0 +1,143 @@
+import logging
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from db_config import get_db_config
+from db_pool import pooled_connection
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("rollups")
+
+
+# Resolution name -> (table, bucket length in seconds, MySQL expression that
+# truncates sensor_data.timestamp to the start of its bucket)
+ROLLUPS: Dict[str, Tuple[str, int, str]] = {
+    "1m": ("sensor_data_1m", 60, "DATE_FORMAT(timestamp, '%Y-%m-%d %H:%i:00')"),
+    "1h": ("sensor_data_1h", 3600, "DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00')"),
+    "1d": ("sensor_data_1d", 86400, "DATE(timestamp)"),
+}
+
+RESOLUTIONS = ["raw"] + list(ROLLUPS)
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Truncate a timestamp to the start of its rollup bucket"""
+    if resolution == "1m":
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == "1d":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution {resolution!r}")
+
+
+def aggregate_rows(
+    rows: List[Tuple[int, float, datetime]],
+) -> Dict[str, List[Tuple[int, datetime, float, float, float, int]]]:
+    """
+    Pre-aggregate (sensor_id, value, timestamp) rows per rollup bucket, so a
+    batch of hundreds of readings becomes a handful of upserts per resolution.
+    """
+    aggregated = {}
+    for resolution in ROLLUPS:
+        buckets: Dict[Tuple[int, datetime], List] = {}
+        for sensor_id, value, timestamp in rows:
+            key = (sensor_id, bucket_start(timestamp, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                if value < bucket[0]:
+                    bucket[0] = value
+                if value > bucket[1]:
+                    bucket[1] = value
+                bucket[2] += value
+                bucket[3] += 1
+        aggregated[resolution] = [
+            (sensor_id, start, mn, mx, total, count)
+            for (sensor_id, start), (mn, mx, total, count) in buckets.items()
+        ]
+    return aggregated
+
+
+def upsert_rollups(cursor, rows: List[Tuple[int, float, datetime]]):
+    """
+    Merge a batch of raw rows into every rollup table. Must run in the same
+    transaction as the sensor_data insert so the rollups never drift from it.
+    """
+    for resolution, buckets in aggregate_rows(rows).items():
+        table = ROLLUPS[resolution][0]
+        cursor.executemany(
+            f"""
+            INSERT INTO {table}
+                (sensor_id, bucket_start, min_value, max_value, sum_value, sample_count)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                min_value = LEAST(min_value, VALUES(min_value)),
+                max_value = GREATEST(max_value, VALUES(max_value)),
+                sum_value = sum_value + VALUES(sum_value),
+                sample_count = sample_count + VALUES(sample_count)
+            """,
+            buckets,
+        )
+
+
+def choose_resolution(start: datetime, end: datetime, max_points: int) -> str:
+    """
+    Pick the finest rollup whose bucket count over [start, end] fits in
+    max_points, falling back to daily buckets for very long ranges
+    """
+    span = max((end - start).total_seconds(), 0)
+    for resolution, (_, seconds, _) in ROLLUPS.items():
+        if span / seconds <= max_points:
+            return resolution
+    return "1d"
+
+
+def backfill_rollups(
+    since: Optional[datetime] = None, logger: Optional[logging.Logger] = None
+) -> bool:
+    """
+    Rebuild rollup buckets from raw sensor_data, e.g. for history stored before
+    the rollup tables existed. Buckets are overwritten, so it is safe to rerun.
+    """
+    logger = logger or get_logger()
+    since = since or datetime(1970, 1, 1)
+
+    try:
+        with pooled_connection(get_db_config()) as conn:
+            cursor = conn.cursor()
+            for resolution, (table, _, truncate) in ROLLUPS.items():
+                # Start from the beginning of the bucket `since` falls in
+                cursor.execute(
+                    f"""
+                    INSERT INTO {table}
+                        (sensor_id, bucket_start, min_value, max_value, sum_value, sample_count)
+                    SELECT sensor_id, {truncate} AS bucket, MIN(value), MAX(value),
+                           SUM(value), COUNT(*)
+                    FROM sensor_data
+                    WHERE timestamp >= %s
+                    GROUP BY sensor_id, bucket
+                    ON DUPLICATE KEY UPDATE
+                        min_value = VALUES(min_value),
+                        max_value = VALUES(max_value),
+                        sum_value = VALUES(sum_value),
+                        sample_count = VALUES(sample_count)
+                    """,
+                    (bucket_start(since, resolution),),
+                )
+                logger.info(f"Backfilled {cursor.rowcount} rows into {table}")
+            cursor.close()
+        return True
+    except Exception as e:
+        logger.error(f"Error backfilling rollups: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # python rollups.py [YYYY-MM-DD] -- backfill rollups from raw history
+    logging.basicConfig(level=logging.INFO)
+    start = datetime.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    sys.exit(0 if backfill_rollups(start) else 1)
@@ -0,0 +1,139 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("rule_engine")
+
+
+class ThresholdRule:
+    """
+    Start the relay when a sensor rises above `start_above` and stop it again
+    once the sensor falls below `stop_below`. The gap between the two is the
+    hysteresis band; a rule only stops a relay that it started itself.
+    """
+
+    def __init__(
+        self,
+        sensor_id: int,
+        start_above: float,
+        stop_below: float,
+        label: str = "Temperature",
+        unit: str = "°C",
+        alert_prefix: str = "temperature",
+    ):
+        if stop_below > start_above:
+            raise ValueError(
+                f"stop_below ({stop_below}) must not be above start_above ({start_above})"
+            )
+        self.sensor_id = sensor_id
+        self.start_above = start_above
+        self.stop_below = stop_below
+        self.label = label
+        self.unit = unit
+        self.alert_prefix = alert_prefix
+
+
+class RuleEngine:
+    """
+    Evaluates threshold rules once per processed ingest message.
+
+    The relay state is kept in memory: it is seeded once at startup, and then
+    follows relay readings in the sensor stream, manual motor commands and the
+    engine's own actions, so evaluating a rule never queries the database.
+    Actions are carried out by the `actuator` callback, which receives the new
+    relay state and the alert describing why, and returns True on success.
+    """
+
+    def __init__(
+        self,
+        rules: List[ThresholdRule],
+        actuator: Callable[[int, Dict[str, Any]], bool],
+        relay_sensor_id: int = 4,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.rules: Dict[int, ThresholdRule] = {rule.sensor_id: rule for rule in rules}
+        self.actuator = actuator
+        self.relay_sensor_id = relay_sensor_id
+        self.logger = logger or get_logger()
+
+        self._lock = threading.Lock()
+        self.relay_state: Optional[int] = None
+        # Sensor ID of the rule that switched the relay on, if any
+        self.started_by: Optional[int] = None
+
+    def set_relay_state(self, state: Optional[int], manual: bool = False):
+        """Record a relay state seen outside the engine (stream or manual command)"""
+        with self._lock:
+            self.relay_state = state
+            if manual and state == 0:
+                # A manual stop overrides any rule that started the motor
+                self.started_by = None
+
+    def evaluate(self, data: Dict[str, Any]):
+        """Apply every matching rule to one processed sensor message"""
+        readings = data.get("readings", [])
+
+        # Relay readings in the same message take precedence over memory
+        for reading in readings:
+            if reading["sensor_id"] == self.relay_sensor_id:
+                self.set_relay_state(1 if reading["value"] == 1 else 0)
+
+        for reading in readings:
+            rule = self.rules.get(reading["sensor_id"])
+            if rule is not None:
+                self._apply(rule, reading["value"])
+
+    def _apply(self, rule: ThresholdRule, value: float):
+        with self._lock:
+            running = self.relay_state == 1
+            if value > rule.start_above and not running:
+                new_state = 1
+            elif (
+                value < rule.stop_below
+                and running
+                and self.started_by == rule.sensor_id
+            ):
+                new_state = 0
+            else:
+                return
+
+        if new_state == 1:
+            self.logger.info(
+                f"{rule.label} ({value}{rule.unit}) exceeds threshold of "
+                f"{rule.start_above:g}{rule.unit}. Starting motor automatically."
+            )
+            alert = {
+                "type": f"{rule.alert_prefix}_high",
+                "message": f"{rule.label} ({value}{rule.unit}) exceeded threshold of "
+                f"{rule.start_above:g}{rule.unit}. Motor started automatically.",
+                rule.alert_prefix: value,
+                "action": "motor_started",
+            }
+        else:
+            self.logger.info(
+                f"{rule.label} ({value}{rule.unit}) fell below threshold of "
+                f"{rule.stop_below:g}{rule.unit}. Stopping motor automatically."
+            )
+            alert = {
+                "type": f"{rule.alert_prefix}_normal",
+                "message": f"{rule.label} ({value}{rule.unit}) fell below threshold of "
+                f"{rule.stop_below:g}{rule.unit}. Motor stopped automatically.",
+                rule.alert_prefix: value,
+                "action": "motor_stopped",
+            }
+
+        try:
+            success = self.actuator(new_state, alert)
+        except Exception as e:
+            self.logger.error(
+                f"Error applying rule for sensor {rule.sensor_id}: {str(e)}"
+            )
+            return
+
+        if success:
+            with self._lock:
+                self.relay_state = new_state
+                self.started_by = rule.sensor_id if new_state == 1 else None
@@ -1,12 +1,19 @@
+import base64
 import logging
-import mysql.connector
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pydantic import BaseModel
 from db_config import get_db_config
+from db_pool import pooled_connection
+from sensor_registry import get_sensor_registry
+from sensor_data_processor import insert_sensor_rows
+from rollups import ROLLUPS, bucket_start, choose_resolution
+from recent_readings import get_recent_buffer
+from latest_values import get_latest_values
 
 
-# Define models for the API responses
+# Models documenting the API responses. The data-access functions return plain
+# dicts in these shapes, so large results are never validated row by row.
 class SensorReading(BaseModel):
     id: int
     value: float
@@ -18,6 +25,25 @@ class SensorData(BaseModel):
     sensor_name: str
     sensor_type: str
     readings: List[SensorReading]
+    next_cursor: Optional[str] = None
+
+
+class HistoryPoint(BaseModel):
+    timestamp: datetime
+    min: float
+    max: float
+    avg: float
+    count: int
+
+
+class SensorHistory(BaseModel):
+    sensor_id: int
+    sensor_name: str
+    sensor_type: str
+    resolution: str
+    start: datetime
+    end: datetime
+    points: List[HistoryPoint]
 
 
 def get_logger():
@@ -29,85 +55,151 @@ def get_sensor_by_id(
     sensor_id: int, logger: Optional[logging.Logger] = None
 ) -> Optional[Dict[str, Any]]:
     """
-    Get sensor details from the database by ID
+    Get sensor details by ID from the in-memory sensor registry
     Returns None if sensor not found
     """
     logger = logger or get_logger()
-    db_config = get_db_config()
-
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
+    return get_sensor_registry().get_by_id(sensor_id, logger)
 
-        cursor.execute("SELECT id, name, type FROM sensors WHERE id = %s", (sensor_id,))
-        sensor = cursor.fetchone()
 
-        cursor.close()
-        conn.close()
+def encode_cursor(timestamp: datetime, reading_id: int) -> str:
+    """Opaque keyset cursor for the reading at (timestamp, id)"""
+    raw = f"{timestamp.isoformat()}|{reading_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-        # If sensor is not a dictionary (e.g., it's a tuple), convert it to a dictionary
-        if sensor and not isinstance(sensor, dict):
-            column_names = ["id", "name", "type"]
-            return dict(
-                zip(column_names, sensor)
-            )  # Return the converted dictionary directly
 
-        # Ensure we're returning either Dict[str, Any] or None
-        return sensor if isinstance(sensor, dict) else None
-    except Exception as e:
-        logger.error(f"Error retrieving sensor with ID {sensor_id}: {str(e)}")
-        return None
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, reading_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _readings_query(
+    sensor_id: int,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[Tuple[datetime, int]],
+) -> Tuple[str, List[Any]]:
+    """
+    Build the newest-first readings query. Paging continues strictly after the
+    (timestamp, id) keyset cursor, so every page is an index range scan
+    instead of an OFFSET that rereads all earlier rows.
+    """
+    conditions = ["sensor_id = %s"]
+    params: List[Any] = [sensor_id]
+    if start is not None:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    if after is not None:
+        conditions.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+        params.extend([after[0], after[0], after[1]])
+
+    query = f"""
+        SELECT id, value, timestamp
+        FROM sensor_data
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp DESC, id DESC
+    """
+    return query, params
 
 
 def get_sensor_readings(
-    sensor_id: int, logger: Optional[logging.Logger] = None
+    sensor_id: int,
+    logger: Optional[logging.Logger] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Get all readings for a specific sensor by ID
+    Get readings for a specific sensor by ID, newest first.
+    Optionally bounded by [start, end), limited to `limit` rows and continuing
+    after a (timestamp, id) keyset cursor
     """
     logger = logger or get_logger()
     db_config = get_db_config()
     result_readings: List[Dict[str, Any]] = []  # Initialize with proper type annotation
 
+    query, params = _readings_query(sensor_id, start, end, after)
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
+        with pooled_connection(db_config) as conn:
+            cursor = conn.cursor(dictionary=True)
 
-        cursor.execute(
-            """
-            SELECT id, value, timestamp 
-            FROM sensor_data 
-            WHERE sensor_id = %s
-            ORDER BY timestamp DESC
-        """,
-            (sensor_id,),
-        )
-
-        readings = cursor.fetchall()
-
-        # Ensure all readings are dictionaries
-        for reading in readings:
-            if isinstance(reading, dict):
-                result_readings.append(reading)
-            else:
-                # Convert tuple to dictionary
-                column_names = ["id", "value", "timestamp"]
-                result_readings.append(dict(zip(column_names, reading)))
-
-        cursor.close()
-        conn.close()
+            cursor.execute(query, params)
+
+            readings = cursor.fetchall()
+
+            # Ensure all readings are dictionaries
+            for reading in readings:
+                if isinstance(reading, dict):
+                    result_readings.append(reading)
+                else:
+                    # Convert tuple to dictionary
+                    column_names = ["id", "value", "timestamp"]
+                    result_readings.append(dict(zip(column_names, reading)))
+
+            cursor.close()
     except Exception as e:
         logger.error(f"Error retrieving readings for sensor ID {sensor_id}: {str(e)}")
 
     return result_readings  # Return the properly typed list
 
 
+def get_readings_batch(
+    sensor_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    batch_size: int = 1000,
+    logger: Optional[logging.Logger] = None,
+) -> List[Tuple[int, float, datetime]]:
+    """
+    One keyset page of (id, value, timestamp) readings, newest first, for
+    streaming exports. The pooled connection is only held for this query, so
+    a slow export client never keeps one checked out between pages.
+    """
+    logger = logger or get_logger()
+    query, params = _readings_query(sensor_id, start, end, after)
+    query += " LIMIT %s"
+    params.append(batch_size)
+
+    try:
+        with pooled_connection(get_db_config()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+    except Exception as e:
+        logger.error(f"Error streaming readings for sensor ID {sensor_id}: {str(e)}")
+        return []
+
+
 def get_complete_sensor_data(
-    sensor_id: int, logger: Optional[logging.Logger] = None
-) -> Optional[SensorData]:
+    sensor_id: int,
+    logger: Optional[logging.Logger] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> Optional[Dict[str, Any]]:
     """
-    Get complete sensor data including all readings by sensor ID
-    Returns a SensorData object or None if sensor not found or error occurs
+    Get complete sensor data including readings by sensor ID.
+    With a limit, one page of readings is returned and next_cursor is set
+    when more readings remain.
+    Returns a dict shaped like SensorData, or None if sensor not found or
+    error occurs
     """
     logger = logger or get_logger()
 
@@ -117,120 +209,142 @@ def get_complete_sensor_data(
         logger.warning(f"Sensor with ID {sensor_id} not found")
         return None
 
-    # Get readings for this sensor
-    readings = get_sensor_readings(sensor_id, logger)
-
-    # Create response object
-    return SensorData(
-        sensor_id=sensor["id"],
-        sensor_name=sensor["name"],
-        sensor_type=sensor["type"],
-        readings=[SensorReading(**reading) for reading in readings],
+    # Get readings for this sensor, one extra to know whether another page exists
+    readings = get_sensor_readings(
+        sensor_id,
+        logger,
+        start=start,
+        end=end,
+        limit=limit + 1 if limit is not None else None,
+        after=after,
     )
 
-
-def get_recent_readings(
+    next_cursor = None
+    if limit is not None and len(readings) > limit:
+        readings = readings[:limit]
+        next_cursor = encode_cursor(readings[-1]["timestamp"], readings[-1]["id"])
+
+    # The cursor already returns {id, value, timestamp} rows
+    return {
+        "sensor_id": sensor["id"],
+        "sensor_name": sensor["name"],
+        "sensor_type": sensor["type"],
+        "readings": readings,
+        "next_cursor": next_cursor,
+    }
+
+
+def get_sensor_history(
+    sensor_id: int,
+    start: datetime,
+    end: datetime,
+    resolution: str = "auto",
+    max_points: int = 500,
     logger: Optional[logging.Logger] = None,
-) -> Dict[int, List[Dict[str, Any]]]:
+) -> Optional[Dict[str, Any]]:
     """
-    Get the 50 most recent readings for each sensor in the database.
-
-    Returns:
-        Dict[int, List[Dict[str, Any]]]: A dictionary with sensor_id as key and list of readings as value
+    Get downsampled history for a sensor between start and end.
+    With resolution "auto" the finest rollup that fits in max_points is used;
+    "raw" returns individual readings (at most max_points of them).
+    Returns a dict shaped like SensorHistory, or None if the sensor is not
+    found or an error occurs
     """
     logger = logger or get_logger()
-    db_config = get_db_config()
-    result = {}
 
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        # First, get all distinct sensor IDs
-        cursor.execute("SELECT DISTINCT sensor_id FROM sensor_data")
-        rows = cursor.fetchall()
-
-        # Properly extract sensor_ids based on the row type
-        sensor_ids = []
-        for row in rows:
-            if isinstance(row, dict):
-                sensor_ids.append(row["sensor_id"])
-            else:
-                # Assuming sensor_id is the first column in the result
-                sensor_ids.append(row[0])
-
-        # For each sensor, get the 50 most recent readings
-        for sensor_id in sensor_ids:
-            cursor.execute(
-                """
-                SELECT id, sensor_id, value, timestamp 
-                FROM sensor_data 
-                WHERE sensor_id = %s
-                ORDER BY timestamp DESC
-                LIMIT 50
-                """,
-                (int(sensor_id),),  # Explicitly cast to int to ensure compatibility
-            )
-            readings = cursor.fetchall()
-
-            # Ensure all readings are dictionaries
-            result_readings = []
-            for reading in readings:
-                if not isinstance(reading, dict):
-                    column_names = ["id", "sensor_id", "value", "timestamp"]
-                    result_readings.append(dict(zip(column_names, reading)))
-                else:
-                    result_readings.append(reading)
+    sensor = get_sensor_by_id(sensor_id, logger)
+    if not sensor:
+        logger.warning(f"Sensor with ID {sensor_id} not found")
+        return None
 
-            result[sensor_id] = result_readings
+    if resolution == "auto":
+        resolution = choose_resolution(start, end, max_points)
 
-        cursor.close()
-        conn.close()
+    # Include the bucket that `start` falls in
+    query_start = start if resolution == "raw" else bucket_start(start, resolution)
 
-        logger.info(f"Retrieved recent readings for {len(sensor_ids)} sensors")
-        return result
+    if resolution == "raw":
+        query = """
+            SELECT timestamp, value AS min_value, value AS max_value,
+                   value AS sum_value, 1 AS sample_count
+            FROM sensor_data
+            WHERE sensor_id = %s AND timestamp >= %s AND timestamp < %s
+            ORDER BY timestamp
+            LIMIT %s
+        """
+    else:
+        table = ROLLUPS[resolution][0]
+        query = f"""
+            SELECT bucket_start AS timestamp, min_value, max_value,
+                   sum_value, sample_count
+            FROM {table}
+            WHERE sensor_id = %s AND bucket_start >= %s AND bucket_start < %s
+            ORDER BY bucket_start
+            LIMIT %s
+        """
 
+    try:
+        with pooled_connection(get_db_config()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, (sensor_id, query_start, end, max_points))
+            points = [
+                {
+                    "timestamp": timestamp,
+                    "min": mn,
+                    "max": mx,
+                    "avg": total / count,
+                    "count": count,
+                }
+                for timestamp, mn, mx, total, count in cursor.fetchall()
+            ]
+            cursor.close()
     except Exception as e:
-        logger.error(f"Error retrieving recent sensor readings: {str(e)}")
-        return {}
+        logger.error(f"Error retrieving history for sensor ID {sensor_id}: {str(e)}")
+        return None
 
+    return {
+        "sensor_id": sensor["id"],
+        "sensor_name": sensor["name"],
+        "sensor_type": sensor["type"],
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "points": points,
+    }
 
-def get_all_sensors(logger: Optional[logging.Logger] = None) -> List[Dict[str, Any]]:
+
+def get_recent_readings(
+    logger: Optional[logging.Logger] = None,
+) -> Dict[int, List[Dict[str, Any]]]:
     """
-    Get all sensors from the database with their IDs and names.
+    Get the 50 most recent readings for each sensor.
+    Served from the in-memory ring buffer; the database is only queried if the
+    buffer could not be seeded at startup.
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries containing sensor information
+        Dict[int, List[Dict[str, Any]]]: A dictionary with sensor_id as key and list of readings as value
     """
     logger = logger or get_logger()
-    db_config = get_db_config()
-    result_sensors: List[Dict[str, Any]] = []
-
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
+    buffer = get_recent_buffer()
 
-        cursor.execute("SELECT id, name, type FROM sensors ORDER BY id")
-        sensors = cursor.fetchall()
+    if not buffer.seeded and not buffer.seed(logger):
+        return {}
 
-        # Ensure all sensors are dictionaries
-        for sensor in sensors:
-            if isinstance(sensor, dict):
-                result_sensors.append(sensor)
-            else:
-                # Convert tuple to dictionary
-                column_names = ["id", "name", "type"]
-                result_sensors.append(dict(zip(column_names, sensor)))
+    result = buffer.snapshot()
+    logger.info(f"Retrieved recent readings for {len(result)} sensors")
+    return result
 
-        cursor.close()
-        conn.close()
 
-        logger.info(f"Retrieved {len(result_sensors)} sensors")
-        return result_sensors
+def get_all_sensors(logger: Optional[logging.Logger] = None) -> List[Dict[str, Any]]:
+    """
+    Get all sensors with their IDs and names from the in-memory sensor registry.
 
-    except Exception as e:
-        logger.error(f"Error retrieving sensors: {str(e)}")
-        return []
+    Returns:
+        List[Dict[str, Any]]: A list of dictionaries containing sensor information
+    """
+    logger = logger or get_logger()
+    result_sensors = get_sensor_registry().get_all(logger)
+    logger.info(f"Retrieved {len(result_sensors)} sensors")
+    return result_sensors
 
 
 def update_relay_state(state: int, logger: Optional[logging.Logger] = None) -> bool:
@@ -247,36 +361,23 @@ def update_relay_state(state: int, logger: Optional[logging.Logger] = None) -> b
     logger = logger or get_logger()
     db_config = get_db_config()
 
-    try:
-        # Get the relay sensor ID (typically ID 4 based on your schema)
-        relay_sensor_id = 4
-
-        # Connect to database
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-
-        # Insert the new relay state
-        now = datetime.now()
-        cursor.execute(
-            "INSERT INTO sensor_data (sensor_id, value, timestamp) VALUES (%s, %s, %s)",
-            (relay_sensor_id, state, now),
-        )
-
-        conn.commit()
-        logger.info(f"Updated relay state in database to {state}")
-
-        cursor.close()
-        conn.close()
-        return True
+    # Get the relay sensor ID (typically ID 4 based on your schema)
+    relay_sensor_id = 4
 
-    except Exception as e:
-        logger.error(f"Error updating relay state in database: {str(e)}")
+    # Insert the new relay state through the ingest writer so rollups stay current
+    now = datetime.now()
+    if not insert_sensor_rows([(relay_sensor_id, state, now)], db_config, logger):
+        logger.error("Error updating relay state in database")
         return False
 
+    logger.info(f"Updated relay state in database to {state}")
+    return True
+
 
 def get_latest_relay_state(logger: Optional[logging.Logger] = None) -> Optional[int]:
     """
-    Get the latest relay state (0 or 1) from the database
+    Get the latest relay state (0 or 1) from the in-memory latest-value map,
+    falling back to the database only if the map could not be loaded
 
     Args:
         logger: Optional logger instance
@@ -285,26 +386,33 @@ def get_latest_relay_state(logger: Optional[logging.Logger] = None) -> Optional[
         int: 1 if relay is on, 0 if relay is off, None if error or no data
     """
     logger = logger or get_logger()
+
+    latest = get_latest_values()
+    if latest.loaded:
+        current = latest.get(4)
+        if current is None:
+            return None
+        return 1 if current[0] == 1 else 0
+
     db_config = get_db_config()
 
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
+        with pooled_connection(db_config) as conn:
+            cursor = conn.cursor()
 
-        # Get the most recent relay reading (sensor_id = 4)
-        cursor.execute(
+            # Get the most recent relay reading (sensor_id = 4)
+            cursor.execute(
+                """
+                SELECT value FROM sensor_data 
+                WHERE sensor_id = 4 
+                ORDER BY timestamp DESC 
+                LIMIT 1
             """
-            SELECT value FROM sensor_data 
-            WHERE sensor_id = 4 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """
-        )
+            )
 
-        result = cursor.fetchone()
+            result = cursor.fetchone()
 
-        cursor.close()
-        conn.close()
+            cursor.close()
 
         if result:
             return 1 if result[0] == 1 or result[0] == True else 0
@@ -1,9 +1,16 @@
-import re
 import logging
-import mysql.connector
+import math
+import time
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, NamedTuple, Tuple, Optional, Union
+from mysql.connector import errors as mysql_errors
 from db_config import get_db_config
+from db_pool import pooled_connection
+from sensor_registry import get_sensor_registry
+from payload_parser import parse_payload
+from rollups import upsert_rollups
+from log_control import get_verbose_topics
+from metrics import COMMIT_SECONDS, INSERT_ROWS, PARSE_SECONDS
 
 
 def get_logger() -> logging.Logger:
@@ -11,109 +18,65 @@ def get_logger() -> logging.Logger:
     return logging.getLogger("sensor_processor")
 
 
-def test_db_connection(logger: Optional[logging.Logger] = None):
-    logger = logger or get_logger()
-    db_config = get_db_config()
-
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sensors LIMIT 5")
-        result = cursor.fetchall()
-        logger.info(f"DB Connection Test - Found sensors: {result}")
-        cursor.close()
-        conn.close()
-        return True
-    except Exception as e:
-        logger.error(f"DB Connection Test Failed: {str(e)}")
-        return False
-
+# Errors caused by the rows themselves (an out-of-range value, a deleted
+# sensor_id) rather than by the statement or the database; only these are
+# worth splitting a batch over. ProgrammingError is left out: it also covers
+# a missing table, denied privileges and syntax errors, which fail every row.
+# Non-finite values (rendered as nan/inf, a ProgrammingError) are caught
+# before they reach the database instead.
+ROW_ERRORS = (
+    mysql_errors.DataError,
+    mysql_errors.IntegrityError,
+)
 
-def parse_sensor_data(message: str) -> List[Tuple[str, float]]:
-    """
-    Parse the sensor data from the message.
-    Format: "Current Sensor 1: 25.467, Temperature Sensor 1: 30.456"
-    Returns a list of tuples (sensor_name, value)
-    """
-    # Split by comma and then parse each sensor reading
-    sensor_readings = []
 
-    # Handle multiple sensors separated by commas
-    parts = [p.strip() for p in message.split(",")]
+class InsertOutcome(NamedTuple):
+    written: int
+    rejected: List[Tuple[int, float, datetime]]  # Rows the database refused
+    failed: List[Tuple[int, float, datetime]]  # Not written, database unavailable
 
-    for part in parts:
-        # Extract sensor name and value using regex
-        match = re.match(r"(.*?):\s*([-+]?\d*\.\d+|\d+)", part)
-        if match:
-            sensor_name = match.group(1).strip()
-            value = float(match.group(2))
-            sensor_readings.append((sensor_name, value))
 
-    return sensor_readings
+# Callbacks notified with every committed batch of (id, sensor_id, value, timestamp)
+_write_listeners: List[
+    Callable[[List[Tuple[Optional[int], int, float, datetime]]], None]
+] = []
 
 
-def get_sensor_ids(
-    sensor_names: List[str], db_config: Dict, logger: Optional[logging.Logger] = None
-) -> Dict[str, int]:
-    """Get sensor IDs from the database based on sensor names"""
-    logger = logger or get_logger()
-    sensor_ids = {}
-
-    try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-
-        # Create a parameterized query with placeholders for all sensor names
-        placeholders = ", ".join(["%s"] * len(sensor_names))
-        query = f"SELECT id, name FROM sensors WHERE name IN ({placeholders})"
+def add_write_listener(
+    callback: Callable[[List[Tuple[Optional[int], int, float, datetime]]], None],
+):
+    """Register a callback invoked after rows are committed to sensor_data"""
+    _write_listeners.append(callback)
 
-        cursor.execute(query, sensor_names)
 
-        for sensor_id, sensor_name in cursor.fetchall():
-            sensor_ids[sensor_name] = sensor_id
+def notify_write_listeners(
+    written: List[Tuple[Optional[int], int, float, datetime]], logger: logging.Logger
+):
+    """Call the write listeners (also used for rows committed by worker processes)"""
+    for listener in _write_listeners:
+        try:
+            listener(written)
+        except Exception as e:
+            logger.error(f"Error in sensor data write listener: {str(e)}")
 
-    except Exception as e:
-        logger.error(f"Database error: {str(e)}")
-    finally:
-        if "cursor" in locals() and cursor:
-            cursor.close()
-        if "conn" in locals() and conn:
-            conn.close()
 
-    return sensor_ids
+def parse_sensor_data(message: str) -> List[Tuple[str, float]]:
+    """
+    Parse the sensor data from the message.
+    Format: "Current Sensor 1: 25.467, Temperature Sensor 1: 30.456"
+    (the compact JSON variant is accepted too, see payload_parser)
+    Returns a list of tuples (sensor_name, value); malformed parts are skipped
+    """
+    return parse_payload(message).readings
 
 
-def insert_sensor_data(
-    sensor_readings: List[Tuple[str, float]],
+def _insert_rows(
+    rows: List[Tuple[int, float, datetime]],
     db_config: Dict,
-    logger: Optional[logging.Logger] = None,
+    logger: logging.Logger,
 ):
-    """Insert sensor readings into sensor_data table"""
-    logger = logger or get_logger()
-
-    if not sensor_readings:
-        return
-
-    # Extract just the sensor names for the lookup
-    sensor_names = [reading[0] for reading in sensor_readings]
-
-    # Get mapping of sensor names to IDs
-    sensor_ids = get_sensor_ids(sensor_names, db_config, logger)
-
-    # Prepare data for insertion
-    now = datetime.now()
-    values_to_insert = []
-
-    for sensor_name, value in sensor_readings:
-        if sensor_name in sensor_ids:
-            values_to_insert.append((sensor_ids[sensor_name], value, now))
-
-    if not values_to_insert:
-        logger.warning("No valid sensor data to insert")
-        return
-
-    try:
-        conn = mysql.connector.connect(**db_config)
+    """Insert and commit one batch with its rollups; raises on failure"""
+    with pooled_connection(db_config) as conn:
         cursor = conn.cursor()
 
         # Insert all readings at once
@@ -122,52 +85,205 @@ def insert_sensor_data(
             VALUES (%s, %s, %s)
         """
 
-        cursor.executemany(insert_query, values_to_insert)
+        started = time.perf_counter()
+        conn.start_transaction()
+        cursor.executemany(insert_query, rows)
+        inserted = cursor.rowcount
+        # A multi-row INSERT reports the ID of its first row; InnoDB hands
+        # a single statement with a known row count a consecutive ID range
+        first_id = cursor.lastrowid
+        upsert_rollups(cursor, rows)
         conn.commit()
+        COMMIT_SECONDS.observe(time.perf_counter() - started)
+        INSERT_ROWS.inc(len(rows), ("committed",))
 
-        logger.info(f"Inserted {cursor.rowcount} sensor readings into database")
+        logger.info("Inserted %d sensor readings into database", inserted)
+        cursor.close()
 
-    except Exception as e:
-        logger.error(f"Error inserting sensor data: {str(e)}")
-    finally:
-        if "cursor" in locals() and cursor:
-            cursor.close()
-        if "conn" in locals() and conn:
-            conn.close()
+    if _write_listeners:
+        written = [
+            (first_id + i if first_id else None, sensor_id, value, timestamp)
+            for i, (sensor_id, value, timestamp) in enumerate(rows)
+        ]
+        notify_write_listeners(written, logger)
 
 
-def process_sensor_message(payload: str, logger: Optional[logging.Logger] = None):
-    """Process an incoming sensor message, save to database, and return processed data"""
+def insert_sensor_rows(
+    rows: List[Tuple[int, float, datetime]],
+    db_config: Dict,
+    logger: Optional[logging.Logger] = None,
+) -> bool:
+    """
+    Insert already-resolved (sensor_id, value, timestamp) rows into sensor_data.
+    The connector rewrites executemany on a plain INSERT into one multi-row
+    statement, so a whole batch costs a single round-trip and commit. The
+    rollup tables are updated in the same transaction, and write listeners
+    are told about the committed rows and their new IDs afterwards.
+    Returns True if the rows were committed.
+    """
     logger = logger or get_logger()
-    logger.info(f"RECEIVED PAYLOAD: {payload}")
 
-    # Database connection configuration
-    db_config = get_db_config()
+    if not rows:
+        return True
 
     try:
-        # Parse the message
-        sensor_readings = parse_sensor_data(payload)
-        logger.info(f"Parsed sensor readings: {sensor_readings}")
+        _insert_rows(rows, db_config, logger)
+        return True
+    except Exception as e:
+        INSERT_ROWS.inc(len(rows), ("failed",))
+        logger.error(f"Error inserting sensor data: {str(e)}")
+        return False
 
-        # Insert into database
-        insert_sensor_data(sensor_readings, db_config, logger)
 
-        # Prepare data for WebSocket broadcast
-        result = {"timestamp": datetime.now().isoformat(), "readings": []}
+def insert_sensor_rows_isolating(
+    rows: List[Tuple[int, float, datetime]],
+    db_config: Dict,
+    logger: Optional[logging.Logger] = None,
+) -> InsertOutcome:
+    """
+    insert_sensor_rows() for a batch that may hold rows the database rejects.
+    A batch that fails with one of ROW_ERRORS is retried in halves, so a bad
+    row only costs itself (and about 2 * log2(batch) extra statements) rather
+    than every reading it was batched with; NaN and infinite values are
+    rejected without a statement. Any other error means the database is
+    unavailable: the rows not yet written are returned as failed without
+    further attempts. Rows are handled in order, so the written and rejected
+    rows always come before the failed ones.
+    """
+    logger = logger or get_logger()
+    written = 0
+    rejected: List[Tuple[int, float, datetime]] = []
+    failed: List[Tuple[int, float, datetime]] = []
+
+    # Halves still to insert, first half on top so rows keep their order
+    pending = [rows] if rows else []
+    while pending:
+        batch = pending.pop()
+        if failed:
+            failed.extend(batch)
+            continue
+        if len(batch) == 1 and not math.isfinite(batch[0][1]):
+            INSERT_ROWS.inc(1, ("rejected",))
+            logger.error(f"Sensor reading with a non-finite value {batch[0]}")
+            rejected.extend(batch)
+            continue
+        if not all(math.isfinite(value) for _, value, _ in batch):
+            # Split around the NaN/inf rows: each is rejected on its own, the
+            # runs between them are inserted as they are
+            parts: List[List[Tuple[int, float, datetime]]] = []
+            run: List[Tuple[int, float, datetime]] = []
+            for row in batch:
+                if math.isfinite(row[1]):
+                    run.append(row)
+                    continue
+                if run:
+                    parts.append(run)
+                    run = []
+                parts.append([row])
+            if run:
+                parts.append(run)
+            pending.extend(reversed(parts))
+            continue
+        try:
+            _insert_rows(batch, db_config, logger)
+            written += len(batch)
+        except ROW_ERRORS as e:
+            if len(batch) == 1:
+                INSERT_ROWS.inc(1, ("rejected",))
+                logger.error(f"Sensor reading rejected by the database {batch[0]}: {e}")
+                rejected.extend(batch)
+            else:
+                middle = len(batch) // 2
+                pending.append(batch[middle:])
+                pending.append(batch[:middle])
+        except Exception as e:
+            logger.error(f"Error inserting sensor data: {str(e)}")
+            failed.extend(batch)
+
+    if failed:
+        INSERT_ROWS.inc(len(failed), ("failed",))
+    return InsertOutcome(written, rejected, failed)
+
+
+def prepare_sensor_message(
+    payload: Union[str, bytes], logger: Optional[logging.Logger] = None
+) -> Optional[Tuple[List[Tuple[int, float, datetime]], Dict]]:
+    """
+    Parse a sensor message (text, JSON or binary) without touching the database.
+    Returns the rows to insert into sensor_data and the data to broadcast to
+    WebSocket clients, or None if the message could not be processed.
+    """
+    logger = logger or get_logger()
 
-        # Get sensor IDs for the readings
+    try:
+        # Parse the message
+        started = time.perf_counter()
+        sensor_readings, errors, id_readings = parse_payload(payload)
+        PARSE_SECONDS.observe(
+            time.perf_counter() - started,
+            ("binary" if isinstance(payload, bytes) else "text",),
+        )
+        if get_verbose_topics().is_verbose("sensors/data"):
+            logger.info("Parsed sensor readings: %s", sensor_readings or id_readings)
+        if errors:
+            logger.warning("Skipped malformed sensor readings: %s", errors)
+
+        # Get sensor IDs for the readings from the in-memory registry
+        registry = get_sensor_registry()
         sensor_names = [reading[0] for reading in sensor_readings]
-        sensor_ids = get_sensor_ids(sensor_names, db_config, logger)
+        sensor_ids = registry.resolve(sensor_names, logger) if sensor_names else {}
 
-        # Format data for WebSocket clients
+        now = datetime.now()
+        rows = []
+        result = {"timestamp": now.isoformat(), "readings": []}
+
+        # Format data for the database and for WebSocket clients
         for sensor_name, value in sensor_readings:
             if sensor_name in sensor_ids:
                 sensor_id = sensor_ids[sensor_name]
+                rows.append((sensor_id, value, now))
                 result["readings"].append(
                     {"sensor_id": sensor_id, "sensor_name": sensor_name, "value": value}
                 )
 
-        return result
+        # Binary records already carry the sensor ID and may carry a device time
+        for sensor_id, value, device_time in id_readings:
+            sensor_name = registry.get_name(sensor_id, logger)
+            if sensor_name is None:
+                continue
+            rows.append((sensor_id, value, device_time or now))
+            reading = {
+                "sensor_id": sensor_id,
+                "sensor_name": sensor_name,
+                "value": value,
+            }
+            if device_time:
+                reading["timestamp"] = device_time.isoformat()
+            result["readings"].append(reading)
+
+        if (sensor_readings or id_readings) and not rows:
+            logger.warning("No valid sensor data to insert")
+
+        return rows, result
     except Exception as e:
         logger.error(f"Error processing sensor message: {str(e)}")
         return None
+
+
+def process_sensor_message(
+    payload: Union[str, bytes], logger: Optional[logging.Logger] = None
+):
+    """Process an incoming sensor message, save to database, and return processed data"""
+    logger = logger or get_logger()
+    logger.debug("Received payload: %r", payload)
+
+    prepared = prepare_sensor_message(payload, logger)
+    if prepared is None:
+        return None
+
+    rows, result = prepared
+
+    # Insert into database
+    insert_sensor_rows(rows, get_db_config(), logger)
+
+    return result
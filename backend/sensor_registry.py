@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from db_config import get_db_config
+from db_pool import pooled_connection
+from metrics import SENSOR_LOOKUPS
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("sensor_registry")
+
+
+class SensorRegistry:
+    """
+    Process-wide, in-memory copy of the `sensors` table.
+
+    The whole table is loaded once and reloaded when the TTL expires or after
+    invalidate(). Names or IDs that are not in the snapshot are looked up with
+    a single batched query; lookups that come back empty are remembered until
+    the next reload so a misconfigured device can't cause a query per message.
+    """
+
+    # Minimum seconds between reload attempts while the database is unreachable
+    RETRY_INTERVAL = 5.0
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        db_config: Optional[Dict[str, Any]] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.ttl = ttl
+        self.db_config = db_config
+        self.logger = logger or get_logger()
+
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_name: Dict[str, int] = {}
+        self._missing_names: Set[str] = set()
+        self._missing_ids: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._last_attempt = float("-inf")
+        # Bumped whenever the set of known sensors may have changed
+        self.generation = 0
+
+    def _fetch(
+        self, where: str = "", params: Iterable[Any] = (), logger=None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Run a sensors query and return rows as dictionaries, None on error"""
+        logger = logger or self.logger
+        try:
+            with pooled_connection(self.db_config or get_db_config()) as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(
+                    f"SELECT id, name, type FROM sensors {where} ORDER BY id",
+                    tuple(params),
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error loading sensors into registry: {str(e)}")
+            return None
+
+        column_names = ["id", "name", "type"]
+        return [
+            row if isinstance(row, dict) else dict(zip(column_names, row))
+            for row in rows
+        ]
+
+    def _add(self, sensors: List[Dict[str, Any]]):
+        # Caller holds the lock
+        self.generation += 1
+        for sensor in sensors:
+            self._by_id[sensor["id"]] = sensor
+            self._by_name[sensor["name"]] = sensor["id"]
+
+    def load(self, logger: Optional[logging.Logger] = None) -> bool:
+        """Reload the whole sensors table into memory"""
+        logger = logger or self.logger
+        self._last_attempt = time.monotonic()
+        sensors = self._fetch(logger=logger)
+        if sensors is None:
+            return False
+
+        with self._lock:
+            self._by_id = {}
+            self._by_name = {}
+            self._missing_names = set()
+            self._missing_ids = set()
+            self._add(sensors)
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"Sensor registry loaded {len(sensors)} sensors")
+        return True
+
+    def invalidate(self):
+        """Force a reload on the next lookup"""
+        with self._lock:
+            self._loaded_at = None
+            self._last_attempt = float("-inf")
+            self.generation += 1
+
+    def _ensure_fresh(self, logger: Optional[logging.Logger] = None):
+        now = time.monotonic()
+        loaded_at = self._loaded_at
+        if loaded_at is not None and now - loaded_at <= self.ttl:
+            return
+        if now - self._last_attempt < self.RETRY_INTERVAL:
+            # A reload failed recently; keep serving the current snapshot
+            return
+        self.load(logger)
+
+    def resolve(
+        self, sensor_names: Iterable[str], logger: Optional[logging.Logger] = None
+    ) -> Dict[str, int]:
+        """Map sensor names to IDs, querying only for names not seen before"""
+        self._ensure_fresh(logger)
+
+        sensor_ids: Dict[str, int] = {}
+        unknown: List[str] = []
+        by_name = self._by_name
+        for name in sensor_names:
+            sensor_id = by_name.get(name)
+            if sensor_id is not None:
+                sensor_ids[name] = sensor_id
+            elif name not in self._missing_names and name not in unknown:
+                unknown.append(name)
+
+        if sensor_ids:
+            SENSOR_LOOKUPS.inc(len(sensor_ids), ("hit",))
+        if unknown:
+            SENSOR_LOOKUPS.inc(len(unknown), ("miss",))
+            placeholders = ", ".join(["%s"] * len(unknown))
+            found = self._fetch(f"WHERE name IN ({placeholders})", unknown, logger)
+            if found is not None:
+                with self._lock:
+                    self._add(found)
+                    self._missing_names.update(
+                        set(unknown) - {sensor["name"] for sensor in found}
+                    )
+                for sensor in found:
+                    sensor_ids[sensor["name"]] = sensor["id"]
+
+        return sensor_ids
+
+    def get_by_id(
+        self, sensor_id: int, logger: Optional[logging.Logger] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get sensor details by ID, or None if no such sensor exists"""
+        self._ensure_fresh(logger)
+
+        sensor = self._by_id.get(sensor_id)
+        if sensor is not None:
+            return dict(sensor)
+        if sensor_id in self._missing_ids:
+            return None
+
+        found = self._fetch("WHERE id = %s", (sensor_id,), logger)
+        if not found:
+            if found is not None:
+                with self._lock:
+                    self._missing_ids.add(sensor_id)
+            return None
+
+        with self._lock:
+            self._add(found)
+        return dict(found[0])
+
+    def get_name(
+        self, sensor_id: int, logger: Optional[logging.Logger] = None
+    ) -> Optional[str]:
+        """Get a sensor's name by ID without copying its details"""
+        self._ensure_fresh(logger)
+        sensor = self._by_id.get(sensor_id)
+        if sensor is not None:
+            return sensor["name"]
+        sensor = self.get_by_id(sensor_id, logger)
+        return sensor["name"] if sensor else None
+
+    def find_by_type(self, sensor_types: Iterable[str]) -> Set[int]:
+        """
+        IDs of known sensors whose type is one of `sensor_types`, compared
+        case-insensitively. Uses the current snapshot without reloading, so it
+        never queries the database (safe to call on the event loop).
+        """
+        wanted = {sensor_type.casefold() for sensor_type in sensor_types}
+        return {
+            sensor_id
+            for sensor_id, sensor in list(self._by_id.items())
+            if (sensor.get("type") or "").casefold() in wanted
+        }
+
+    def get_all(self, logger: Optional[logging.Logger] = None) -> List[Dict[str, Any]]:
+        """All known sensors ordered by ID"""
+        self._ensure_fresh(logger)
+        by_id = self._by_id
+        return [dict(by_id[sensor_id]) for sensor_id in sorted(by_id)]
+
+
+# Shared registry used by the ingest path and the API
+sensor_registry = SensorRegistry()
+
+
+def get_sensor_registry() -> SensorRegistry:
+    """Get the process-wide sensor registry"""
+    return sensor_registry
@@ -0,0 +1,42 @@
+from decimal import Decimal
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Sensor IDs are used as dict keys (e.g. recent readings); like json.dumps,
+# write them as strings instead of rejecting them
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson doesn't encode natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode to compact UTF-8 JSON. Naive datetimes come out as isoformat()
+    strings, so database rows can be passed as they are.
+    """
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+def dumps_text(obj: Any) -> str:
+    """dumps() as a str, for WebSocket text frames"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with orjson. Routes that build large bodies return
+    it directly, which also skips FastAPI's response_model validation and
+    jsonable_encoder pass over every row.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,578 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from threading import Thread
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from db_config import get_db_config, get_spool_config
+from sensor_data_processor import insert_sensor_rows_isolating
+
+# One spooled reading: CRC-32 of the rest, sensor_id, value, and the naive
+# timestamp as microseconds since 1970-01-01. Preallocated segment space is
+# zero-filled, and a zeroed record fails the CRC check, so the first invalid
+# record marks the end of the data after a restart or crash.
+RECORD = struct.Struct("<Iidq")
+BODY = struct.Struct("<idq")
+CRC = struct.Struct("<I")
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+SEGMENT_NAME = re.compile(r"^(\d{12})\.seg$")
+CHECKPOINT = "checkpoint.json"
+# Rows the database refused on replay, in the segment record format. When
+# the current file is full it becomes the previous one, replacing it.
+QUARANTINE = "rejected.dat"
+QUARANTINE_PREVIOUS = "rejected.1.dat"
+
+# (segment sequence number, byte offset)
+Position = Tuple[int, int]
+
+
+class SpoolBatch(NamedTuple):
+    rows: List[Tuple[int, float, datetime]]
+    # Position after the last row, to pass to Spool.commit()
+    position: Position
+    # (rows before it, start position) of every contiguous run that was read
+    runs: List[Tuple[int, Position]]
+
+    def position_after(self, count: int) -> Position:
+        """Position just after the first `count` rows of the batch"""
+        if count >= len(self.rows):
+            return self.position
+        for before, (seq, offset) in reversed(self.runs):
+            if before <= count:
+                return seq, offset + (count - before) * RECORD.size
+        return self.runs[0][1]
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("spool")
+
+
+def encode_rows(rows: List[Tuple[int, float, datetime]]) -> bytearray:
+    buffer = bytearray(RECORD.size * len(rows))
+    view = memoryview(buffer)
+    offset = 0
+    for sensor_id, value, timestamp in rows:
+        BODY.pack_into(
+            buffer,
+            offset + CRC.size,
+            sensor_id,
+            value,
+            (timestamp - EPOCH) // MICROSECOND,
+        )
+        CRC.pack_into(
+            buffer, offset, zlib.crc32(view[offset + CRC.size : offset + RECORD.size])
+        )
+        offset += RECORD.size
+    return buffer
+
+
+def decode_rows(
+    data: bytes, limit: int
+) -> Tuple[List[Tuple[int, float, datetime]], int, bool]:
+    """
+    Up to `limit` rows from the start of `data`. Returns the rows, the bytes
+    they took, and whether decoding stopped at an invalid record.
+    """
+    rows = []
+    view = memoryview(data)
+    offset = 0
+    end = min(len(data) - len(data) % RECORD.size, limit * RECORD.size)
+    while offset < end:
+        crc, sensor_id, value, micros = RECORD.unpack_from(data, offset)
+        if crc != zlib.crc32(view[offset + CRC.size : offset + RECORD.size]):
+            return rows, offset, True
+        rows.append((sensor_id, value, EPOCH + micros * MICROSECOND))
+        offset += RECORD.size
+    return rows, offset, False
+
+
+class Spool:
+    """
+    Append-only, memory-mapped on-disk buffer of sensor_data rows, for when
+    the database is down or too slow to keep up with ingest.
+
+    Rows are appended as fixed-size records to preallocated segment files
+    that are mapped into memory, so a write is a memcpy into the page cache
+    (sequential I/O once the kernel writes it back). The mapping is msync'ed
+    every `sync_interval` seconds and on rotation. A checkpoint file records
+    how far the replayer got; fully replayed segments are deleted. When the
+    segments would exceed `max_bytes`, the oldest one is dropped (and its
+    unreplayed rows counted as lost) so the disk budget always holds. Rows
+    the database refuses on replay are moved to a quarantine file so they
+    can't hold up the rest; one segment's worth of the budget is set aside
+    for it, split between the current and the previous quarantine file.
+
+    One thread appends (the ingest writer), another reads and commits (the
+    replayer).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 16 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        sync_interval: float = 1.0,
+        stall_after: int = 5,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.directory = directory
+        # Whole records only, and at least two segments within the budget
+        self.segment_size = max(segment_size - segment_size % RECORD.size, RECORD.size)
+        # One segment of the budget is kept for the two quarantine files
+        self.max_segments = max(max_bytes // self.segment_size - 1, 2)
+        self.quarantine_file_size = max(
+            self.segment_size // 2 - self.segment_size // 2 % RECORD.size,
+            RECORD.size,
+        )
+        self.sync_interval = sync_interval
+        self.stall_after = stall_after
+        self.logger = logger or get_logger()
+
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._write_seq = 0
+        self._write_offset = 0
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._last_sync = time.monotonic()
+        self._checkpoint: Position = (1, 0)
+        # Failed replay attempts since the checkpoint last moved
+        self._replay_failures = 0
+
+        # Counters
+        self._rows_appended = 0
+        self._rows_replayed = 0
+        self._rows_rejected = 0
+        self._rows_lost = 0
+        self._quarantine_bytes = 0
+        self._quarantine_previous_bytes = 0
+        self._quarantine_discarded = 0
+        self._segments_dropped = 0
+
+    # Opening and recovery
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}.seg")
+
+    def open(self) -> "Spool":
+        """Create or recover the spool; appends continue after the last valid record"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_NAME.match, os.listdir(self.directory))
+            if match
+        )
+
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                checkpoint = json.load(f)
+            self._checkpoint = (int(checkpoint["segment"]), int(checkpoint["offset"]))
+        except FileNotFoundError:
+            self._checkpoint = (self._segments[0] if self._segments else 1, 0)
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"Unreadable spool checkpoint, replaying everything: {e}")
+            self._checkpoint = (self._segments[0] if self._segments else 1, 0)
+
+        self._quarantine_bytes = self._file_size(QUARANTINE)
+        self._quarantine_previous_bytes = self._file_size(QUARANTINE_PREVIOUS)
+
+        if self._segments:
+            seq = self._segments[-1]
+            self._open_segment(seq)
+            self._write_offset = self._find_end(seq)
+        else:
+            self._open_segment(self._checkpoint[0])
+
+        backlog = self.backlog_rows()
+        if backlog:
+            self.logger.info(
+                f"Spool {self.directory} recovered with about {backlog} rows to replay"
+            )
+        return self
+
+    def _file_size(self, name: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.directory, name))
+        except OSError:
+            return 0
+
+    def _find_end(self, seq: int) -> int:
+        """Offset just after the last valid record of a mapped segment"""
+        start = self._checkpoint[1] if seq == self._checkpoint[0] else 0
+        _, length, _ = decode_rows(self._map[start:], self.segment_size)
+        return start + length
+
+    def _open_segment(self, seq: int):
+        # Caller holds the lock (or is open())
+        path = self._segment_path(seq)
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size < self.segment_size:
+            # Sparse preallocation; unwritten space reads back as zeros
+            self._file.truncate(self.segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._write_seq = seq
+        self._write_offset = 0
+        if seq not in self._segments:
+            self._segments.append(seq)
+
+    def _close_segment(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Writing
+
+    def append(self, rows: List[Tuple[int, float, datetime]]) -> int:
+        """Append rows; returns the number written"""
+        if not rows:
+            return 0
+        data = encode_rows(rows)
+        with self._lock:
+            if self._map is None:
+                raise RuntimeError("Spool is closed")
+            written = 0
+            while written < len(data):
+                room = self.segment_size - self._write_offset
+                if room == 0:
+                    self._rotate()
+                    continue
+                chunk = min(room, len(data) - written)
+                self._map[self._write_offset : self._write_offset + chunk] = data[
+                    written : written + chunk
+                ]
+                self._write_offset += chunk
+                written += chunk
+            self._rows_appended += len(rows)
+
+            now = time.monotonic()
+            if now - self._last_sync >= self.sync_interval:
+                self._map.flush()
+                self._last_sync = now
+        return len(rows)
+
+    def _rotate(self):
+        # Caller holds the lock
+        self._close_segment()
+        while len(self._segments) >= self.max_segments:
+            self._drop_oldest()
+        self._open_segment(self._write_seq + 1)
+
+    def _drop_oldest(self):
+        """Give up the oldest segment to stay within the disk budget"""
+        seq = self._segments.pop(0)
+        start = self._checkpoint[1] if seq == self._checkpoint[0] else 0
+        if seq >= self._checkpoint[0]:
+            lost = (self.segment_size - start) // RECORD.size
+            self._rows_lost += lost
+            self.logger.error(
+                f"Spool over its {self.max_segments * self.segment_size} byte budget, "
+                f"dropped segment {seq} with up to {lost} unreplayed rows"
+            )
+            self._checkpoint = (seq + 1, 0)
+            self._write_checkpoint()
+        self._segments_dropped += 1
+        try:
+            os.remove(self._segment_path(seq))
+        except OSError:
+            pass
+
+    # Reading and checkpointing
+
+    def read(self, max_rows: int) -> SpoolBatch:
+        """
+        Up to `max_rows` rows after the checkpoint, with the position to pass
+        to commit() once they are safely in the database
+        """
+        with self._lock:
+            seq, offset = self._checkpoint
+            write_seq, write_offset = self._write_seq, self._write_offset
+            segments = list(self._segments)
+
+        rows: List[Tuple[int, float, datetime]] = []
+        runs: List[Tuple[int, Position]] = []
+        while len(rows) < max_rows and (seq, offset) < (write_seq, write_offset):
+            if seq not in segments:
+                # Dropped or never written (e.g. a gap after a crash)
+                seq, offset = self._next_segment(seq, segments), 0
+                continue
+            end = write_offset if seq == write_seq else self.segment_size
+            wanted = min(end - offset, (max_rows - len(rows)) * RECORD.size)
+            try:
+                with open(self._segment_path(seq), "rb") as f:
+                    f.seek(offset)
+                    data = f.read(wanted)
+            except FileNotFoundError:
+                seq, offset = self._next_segment(seq, segments), 0
+                continue
+            batch, length, invalid = decode_rows(data, max_rows - len(rows))
+            if batch:
+                runs.append((len(rows), (seq, offset)))
+            rows.extend(batch)
+            offset += length
+            if seq != write_seq and (invalid or offset >= end):
+                # The rest of a closed segment holds no records
+                seq, offset = self._next_segment(seq, segments), 0
+            elif invalid or not batch:
+                break
+        return SpoolBatch(rows, (seq, offset), runs)
+
+    def _next_segment(self, seq: int, segments: List[int]) -> int:
+        later = [s for s in segments if s > seq]
+        return later[0] if later else self._write_seq
+
+    def commit(self, position: Position, rows: int = 0):
+        """Move the checkpoint to `position` and delete fully replayed segments"""
+        with self._lock:
+            if position <= self._checkpoint:
+                # The budget dropped the segment the read came from
+                return
+            self._checkpoint = position
+            self._rows_replayed += rows
+            self._replay_failures = 0
+            self._write_checkpoint()
+            for seq in [s for s in self._segments if s < position[0]]:
+                self._segments.remove(seq)
+                try:
+                    os.remove(self._segment_path(seq))
+                except OSError:
+                    pass
+
+    def replay_failed(self):
+        """Record a replay attempt that couldn't move the checkpoint"""
+        self._replay_failures += 1
+
+    def quarantine(self, rows: List[Tuple[int, float, datetime]]):
+        """Set aside rows the database refused, so replay can move past them"""
+        data = encode_rows(rows)[-self.quarantine_file_size :]
+        with self._lock:
+            if self._quarantine_bytes + len(data) > self.quarantine_file_size:
+                # Rotate, giving up the previous file to stay within the budget
+                self._quarantine_discarded += (
+                    self._quarantine_previous_bytes // RECORD.size
+                )
+                current = os.path.join(self.directory, QUARANTINE)
+                if os.path.exists(current):
+                    os.replace(
+                        current, os.path.join(self.directory, QUARANTINE_PREVIOUS)
+                    )
+                self._quarantine_previous_bytes = self._quarantine_bytes
+                self._quarantine_bytes = 0
+            with open(os.path.join(self.directory, QUARANTINE), "ab") as f:
+                f.write(data)
+            self._quarantine_bytes += len(data)
+            self._rows_rejected += len(rows)
+            self._quarantine_discarded += len(rows) - len(data) // RECORD.size
+        self.logger.error(
+            f"Moved {len(rows)} spooled rows the database rejected to {QUARANTINE}"
+        )
+
+    def _write_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT)
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(
+                {"segment": self._checkpoint[0], "offset": self._checkpoint[1]}, f
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def backlog_rows(self) -> int:
+        """Approximate rows appended but not yet replayed"""
+        seq, offset = self._checkpoint
+        if (seq, offset) >= (self._write_seq, self._write_offset):
+            return 0
+        segments_between = sum(1 for s in self._segments if seq <= s < self._write_seq)
+        return (
+            segments_between * self.segment_size + self._write_offset - offset
+        ) // RECORD.size
+
+    def has_backlog(self) -> bool:
+        return self._checkpoint < (self._write_seq, self._write_offset)
+
+    def stalled(self) -> bool:
+        """Replay has failed `stall_after` times in a row at the same position"""
+        return self._replay_failures >= self.stall_after
+
+    def diverting(self) -> bool:
+        """
+        Whether new rows should queue up behind the backlog instead of going
+        to the database: there is a backlog and its replay is making progress
+        """
+        return self.has_backlog() and not self.stalled()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "segments": len(self._segments),
+                "max_segments": self.max_segments,
+                "segment_size": self.segment_size,
+                "write_position": [self._write_seq, self._write_offset],
+                "checkpoint": list(self._checkpoint),
+                "backlog_rows": self.backlog_rows(),
+                "rows_appended": self._rows_appended,
+                "rows_replayed": self._rows_replayed,
+                "rows_rejected": self._rows_rejected,
+                "quarantine_bytes": (
+                    self._quarantine_bytes + self._quarantine_previous_bytes
+                ),
+                "quarantine_max_bytes": 2 * self.quarantine_file_size,
+                "quarantine_rows_discarded": self._quarantine_discarded,
+                "rows_lost": self._rows_lost,
+                "replay_failures": self._replay_failures,
+                "stalled": self.stalled(),
+                "segments_dropped": self._segments_dropped,
+            }
+
+
+class SpoolReplayer:
+    """
+    Background thread draining a Spool into sensor_data in batches of up to
+    `batch_size` rows. The checkpoint only moves after a batch is committed,
+    so a crash replays at most one batch twice. A batch the database rejects
+    is retried in halves and the rows it still refuses are quarantined, so
+    the checkpoint moves past them. While the database keeps failing, retries
+    back off exponentially up to `max_backoff` seconds.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        batch_size: int = 5000,
+        interval: float = 0.5,
+        max_backoff: float = 30.0,
+        db_config: Optional[Dict[str, Any]] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.spool = spool
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.db_config = db_config or get_db_config()
+        self.logger = logger or get_logger()
+        self._stop = threading.Event()
+        self._thread: Optional[Thread] = None
+        self._failures = 0
+        self.batches = 0
+        self.last_error_at: Optional[datetime] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="spool-replayer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def replay_once(self) -> Optional[int]:
+        """Replay one batch; returns rows committed, or None if the insert failed"""
+        batch = self.spool.read(self.batch_size)
+        if not batch.rows:
+            self.spool.commit(batch.position)
+            return 0
+
+        outcome = insert_sensor_rows_isolating(batch.rows, self.db_config, self.logger)
+        if outcome.rejected:
+            self.spool.quarantine(outcome.rejected)
+        # Written and rejected rows come before the failed ones, so moving the
+        # checkpoint over them keeps a retry from inserting any row twice
+        handled = len(batch.rows) - len(outcome.failed)
+        if handled:
+            self.spool.commit(batch.position_after(handled), outcome.written)
+            self.batches += 1
+        return None if outcome.failed else len(batch.rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                replayed = self.replay_once()
+            except Exception as e:
+                self.logger.error(f"Error replaying spool: {str(e)}")
+                replayed = None
+
+            if replayed is None:
+                self.spool.replay_failed()
+                self._failures += 1
+                self.last_error_at = datetime.now()
+                delay = min(self.interval * 2**self._failures, self.max_backoff)
+            else:
+                if self._failures:
+                    self.logger.info("Spool replay resumed")
+                self._failures = 0
+                # Keep going while there is a backlog
+                delay = 0 if replayed >= self.batch_size else self.interval
+            self._stop.wait(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.spool.stats(),
+            "replay_batches": self.batches,
+            "consecutive_failures": self._failures,
+            "last_error_at": (
+                self.last_error_at.isoformat() if self.last_error_at else None
+            ),
+        }
+
+
+def open_spool(
+    directory: Optional[str] = None, logger: Optional[logging.Logger] = None
+) -> Tuple[Spool, SpoolReplayer]:
+    """Open the configured spool (or one in `directory`) and its replayer"""
+    config = get_spool_config()
+    spool = Spool(
+        directory or config["directory"],
+        segment_size=config["segment_size"],
+        max_bytes=config["max_bytes"],
+        sync_interval=config["sync_interval"],
+        stall_after=config["replay_stall_after"],
+        logger=logger,
+    ).open()
+    replayer = SpoolReplayer(
+        spool,
+        batch_size=config["replay_batch_size"],
+        interval=config["replay_interval"],
+        logger=logger,
+    )
+    return spool, replayer
+
+
+if __name__ == "__main__":
+    # python spool.py -- drain the configured spool into the database once
+    logging.basicConfig(level=logging.INFO)
+    spool, replayer = open_spool()
+    total = 0
+    while spool.has_backlog():
+        replayed = replayer.replay_once()
+        if replayed is None:
+            get_logger().error("Replay failed, stopping")
+            sys.exit(1)
+        if not replayed:
+            break
+        total += replayed
+    spool.close()
+    print(f"Replayed {total} rows")
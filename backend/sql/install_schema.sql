@@ -17,6 +17,48 @@ CREATE TABLE IF NOT EXISTS sensor_data (
     sensor_id INT NOT NULL,
     value DOUBLE NOT NULL,
     timestamp DATETIME NOT NULL,
+    INDEX idx_sensor_data_sensor_time (sensor_id, timestamp),
+    FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+        ON DELETE CASCADE
+);
+
+-- Later schema changes (and this index, for older installs) are applied by
+-- migrations.py when the backend starts
+
+-- Rollup tables: per-sensor min/max/sum/count for 1-minute, 1-hour and 1-day
+-- buckets, maintained by the ingest path in the same transaction as sensor_data
+CREATE TABLE IF NOT EXISTS sensor_data_1m (
+    sensor_id INT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (sensor_id, bucket_start),
+    FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+        ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS sensor_data_1h (
+    sensor_id INT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (sensor_id, bucket_start),
+    FOREIGN KEY (sensor_id) REFERENCES sensors(id)
+        ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS sensor_data_1d (
+    sensor_id INT NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    min_value DOUBLE NOT NULL,
+    max_value DOUBLE NOT NULL,
+    sum_value DOUBLE NOT NULL,
+    sample_count INT NOT NULL,
+    PRIMARY KEY (sensor_id, bucket_start),
     FOREIGN KEY (sensor_id) REFERENCES sensors(id)
         ON DELETE CASCADE
 );
@@ -0,0 +1,245 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import threading
+from datetime import datetime
+from email.utils import formatdate
+from pathlib import Path
+from threading import Thread
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+try:
+    from watchfiles import watch
+except ImportError:  # optional: only needed for hot reload
+    watch = None
+
+# Vite names build output like index-sszf5xoO.js; the hash changes with the
+# content, so those files can be cached forever
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Smaller files aren't worth the Content-Encoding overhead
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("static_assets")
+
+
+class Asset(NamedTuple):
+    media_type: str
+    cache_control: str
+    last_modified: str
+    # Content-Encoding ("identity", "br", "gzip") -> (body, ETag)
+    variants: Dict[str, Tuple[bytes, str]]
+
+
+def _compress(data: bytes, media_type: str) -> Dict[str, bytes]:
+    """Precompressed variants that actually come out smaller than `data`"""
+    if len(data) < MIN_COMPRESS_SIZE or not media_type.startswith(COMPRESSIBLE_TYPES):
+        return {}
+    variants = {}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    # mtime=0 keeps the output (and so its ETag) the same across reloads
+    variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+    return {name: body for name, body in variants.items() if len(body) < len(data)}
+
+
+def _load_asset(path: Path, url_path: str) -> Asset:
+    data = path.read_bytes()
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    digest = hashlib.blake2b(data, digest_size=12).hexdigest()
+
+    variants = {"identity": (data, f'"{digest}"')}
+    for encoding, body in _compress(data, media_type).items():
+        # Each encoding is a different representation, so it needs its own
+        # strong ETag
+        variants[encoding] = (body, f'"{digest}-{encoding}"')
+
+    hashed = url_path.startswith("assets/") and HASHED_NAME.search(path.name)
+    return Asset(
+        media_type=media_type,
+        cache_control=IMMUTABLE if hashed else REVALIDATE,
+        last_modified=formatdate(path.stat().st_mtime, usegmt=True),
+        variants=variants,
+    )
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(asset: Asset, accept_encoding: str) -> str:
+    """Best precompressed variant the client accepts, brotli first"""
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding not in asset.variants:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """
+    The built SPA (frontend/dist) held in memory, with gzip and, if the brotli
+    package is installed, brotli variants precomputed at load time.
+
+    Requests are answered without touching the disk: the encoding is
+    negotiated from Accept-Encoding, every variant has a strong ETag, and
+    content-hashed files under assets/ are marked immutable. With
+    watchfiles installed, start_watching() reloads everything whenever the
+    build output changes.
+    """
+
+    def __init__(self, directory: Path, logger: Optional[logging.Logger] = None):
+        self.directory = Path(directory)
+        self.logger = logger or get_logger()
+        self._assets: Dict[str, Asset] = {}
+        self._stop = threading.Event()
+        self._watcher: Optional[Thread] = None
+        self.loaded_at: Optional[datetime] = None
+        self.reloads = 0
+
+    def load(self) -> bool:
+        """Read and precompress every file under the directory"""
+        if not (self.directory / "index.html").is_file():
+            # Also the state in the middle of a rebuild: keep serving the old copy
+            self.logger.warning(f"No built frontend in {self.directory}")
+            return False
+
+        assets: Dict[str, Asset] = {}
+        try:
+            for path in sorted(self.directory.rglob("*")):
+                if path.is_file():
+                    url_path = path.relative_to(self.directory).as_posix()
+                    assets[url_path] = _load_asset(path, url_path)
+        except OSError as e:
+            self.logger.error(f"Error loading frontend assets: {str(e)}")
+            return False
+
+        # Swap the whole set at once so requests never see a partial build
+        self._assets = assets
+        self.loaded_at = datetime.now()
+        self.reloads += 1
+        self.logger.info(
+            f"Loaded {len(assets)} frontend files "
+            f"({'brotli and gzip' if brotli else 'gzip'} precompressed)"
+        )
+        return True
+
+    def get(self, url_path: str) -> Optional[Asset]:
+        return self._assets.get(url_path)
+
+    def response(self, request: Request, url_path: str) -> Optional[Response]:
+        """The negotiated variant of a file, a 304, or None if there is no such file"""
+        asset = self._assets.get(url_path)
+        if asset is None:
+            return None
+
+        encoding = choose_encoding(asset, request.headers.get("accept-encoding", ""))
+        body, etag = asset.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": asset.cache_control,
+        }
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and (
+            if_none_match.strip() == "*"
+            or etag in (tag.strip() for tag in if_none_match.split(","))
+        ):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+    def start_watching(self):
+        """Reload whenever the build output changes (requires watchfiles)"""
+        if watch is None:
+            self.logger.warning("watchfiles is not installed; hot reload disabled")
+            return
+        if self._watcher and self._watcher.is_alive():
+            return
+        if not self.directory.is_dir():
+            self.logger.warning(f"Not watching missing directory {self.directory}")
+            return
+        self._stop.clear()
+        self._watcher = Thread(target=self._watch, name="static-assets-watcher")
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout)
+            self._watcher = None
+
+    def _watch(self):
+        # watch() debounces the burst of events a build produces into one batch
+        for changes in watch(self.directory, stop_event=self._stop):
+            self.logger.info(
+                f"Frontend build changed ({len(changes)} files), reloading"
+            )
+            self.load()
+
+    def stats(self) -> Dict[str, Any]:
+        files: List[Dict[str, Any]] = [
+            {
+                "path": url_path,
+                "cache_control": asset.cache_control,
+                "bytes": {
+                    encoding: len(body)
+                    for encoding, (body, _) in asset.variants.items()
+                },
+            }
+            for url_path, asset in sorted(self._assets.items())
+        ]
+        return {
+            "directory": str(self.directory),
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reloads": self.reloads,
+            "watching": bool(self._watcher and self._watcher.is_alive()),
+            "brotli": brotli is not None,
+            "files": files,
+        }
@@ -0,0 +1,204 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from threading import Thread
+from typing import Any, Deque, Dict, Optional
+
+# Stages in the order a message passes through them. Each is recorded as the
+# time since the MQTT receive stamp. A message's rows reach either "commit"
+# (written to sensor_data) or "spool" (written to the local spool instead).
+STAGES = ("queue", "parse", "enqueue", "send", "commit", "spool", "total")
+
+
+def get_logger() -> logging.Logger:
+    """Get or create a module-level logger"""
+    return logging.getLogger("tracing")
+
+
+class Trace:
+    """
+    Timeline of one sensors/data message, from the monotonic receive stamp
+    taken in MQTTHandler._on_message to the DB commit (or spool write) and the
+    last WebSocket send. The trace is complete once every part it waits for
+    (the flush and one send per client it was queued for) has finished or was
+    dropped.
+    """
+
+    __slots__ = ("tracer", "received", "wall_time", "stages", "_pending", "_lock")
+
+    def __init__(self, tracer: "Tracer", received: float):
+        self.tracer = tracer
+        self.received = received
+        self.wall_time = time.time() - (time.monotonic() - received)
+        self.stages: Dict[str, Any] = {}
+        # The flush, plus one part per client once the broadcast is queued
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    def mark(self, stage: str) -> float:
+        """Record a stage as reached now; returns its latency in seconds"""
+        elapsed = time.monotonic() - self.received
+        self.stages.setdefault(stage, elapsed)
+        self.tracer.observe(stage, elapsed)
+        return elapsed
+
+    def expect(self, parts: int):
+        """The message was queued for `parts` more deliveries"""
+        with self._lock:
+            self._pending += parts
+
+    def sent(self):
+        """One client received the message (stages keep the first and last send)"""
+        elapsed = self.mark("send")
+        with self._lock:
+            self.stages["send_last"] = elapsed
+            self.stages["clients"] = self.stages.get("clients", 0) + 1
+        self.done()
+
+    def done(self):
+        """One awaited part finished (or was dropped)"""
+        with self._lock:
+            self._pending -= 1
+            finished = self._pending == 0
+        if finished:
+            self.stages["total"] = self.mark("total")
+            self.tracer.finish(self)
+
+
+class Tracer:
+    """
+    Aggregates stage latencies over the last `window` messages into
+    percentiles, and optionally appends a sample of complete traces to a
+    JSON-lines file from a background thread.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {
+            stage: deque(maxlen=window) for stage in STAGES
+        }
+        self.export_path: Optional[str] = None
+        self.export_rate = 0.0
+        self._export_queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = (
+            queue.SimpleQueue()
+        )
+        self._exporter: Optional[Thread] = None
+        self._exported = 0
+
+    def start(self, received: float) -> Trace:
+        """Begin a trace for a message received at monotonic time `received`"""
+        return Trace(self, received)
+
+    def observe(self, stage: str, elapsed: float):
+        samples = self._samples.get(stage)
+        if samples is not None:
+            # deque.append is atomic, so no lock is needed here
+            samples.append(elapsed)
+
+    def finish(self, trace: Trace):
+        if self.export_path and random.random() < self.export_rate:
+            self._export_queue.put(
+                {
+                    "received_at": datetime.fromtimestamp(trace.wall_time).isoformat(),
+                    **{
+                        key: (
+                            round(value * 1000, 3)
+                            if isinstance(value, float)
+                            else value
+                        )
+                        for key, value in trace.stages.items()
+                    },
+                }
+            )
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        """p50/p90/p99/max per stage, in milliseconds"""
+        result = {}
+        for stage, samples in self._samples.items():
+            values = sorted(samples)
+            if not values:
+                continue
+            last = len(values) - 1
+            result[stage] = {
+                "count": len(values),
+                "p50_ms": values[int(last * 0.50)] * 1000,
+                "p90_ms": values[int(last * 0.90)] * 1000,
+                "p99_ms": values[int(last * 0.99)] * 1000,
+                "max_ms": values[last] * 1000,
+            }
+        return result
+
+    def start_export(self, path: str, rate: float):
+        """Append a `rate` fraction of complete traces to `path` as JSON lines"""
+        self.export_path = path
+        self.export_rate = rate
+        if self._exporter is None:
+            self._exporter = Thread(target=self._export, name="trace-exporter")
+            self._exporter.daemon = True
+            self._exporter.start()
+
+    def stop_export(self):
+        """Write out queued traces and stop exporting"""
+        self.export_rate = 0.0
+        if self._exporter is not None:
+            self._export_queue.put(None)
+            self._exporter.join(5.0)
+            self._exporter = None
+        self.export_path = None
+
+    def _export(self):
+        while True:
+            record = self._export_queue.get()
+            if record is None:
+                return
+            lines = [record]
+            # Write whatever else is waiting in the same call
+            while True:
+                try:
+                    record = self._export_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._export_queue.put(None)
+                    break
+                lines.append(record)
+            try:
+                with open(self.export_path or "", "a") as f:
+                    f.write("".join(json.dumps(line) + "\n" for line in lines))
+                self._exported += len(lines)
+            except Exception as e:
+                get_logger().error(f"Error exporting traces: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "export_path": self.export_path,
+            "export_rate": self.export_rate,
+            "exported": self._exported,
+            "stages": self.percentiles(),
+        }
+
+
+# Shared tracer; the message being processed on the current thread is kept in
+# a thread-local so listeners can pass it on without changing their signature
+tracer = Tracer()
+_current = threading.local()
+
+
+def get_tracer() -> Tracer:
+    """Get the process-wide tracer"""
+    return tracer
+
+
+def set_current_trace(trace: Optional[Trace]):
+    _current.trace = trace
+
+
+def current_trace() -> Optional[Trace]:
+    """Trace of the message whose listeners are running on this thread"""
+    return getattr(_current, "trace", None)
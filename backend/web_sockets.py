@@ -1,6 +1,12 @@
+import asyncio
 import logging
+import time
 from fastapi import WebSocket
-from typing import List
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from metrics import BROADCAST_SECONDS
+from sensor_registry import get_sensor_registry
+from serialization import dumps_text
+from tracing import Trace
 
 # Configure logging
 logging.basicConfig(
@@ -10,25 +16,475 @@ logging.basicConfig(
 logger = logging.getLogger("app")
 
 
-class ConnectionManager:
+def serialize_message(message: Dict[str, Any]) -> str:
+    """
+    Encode a message for a text frame, compact like WebSocket.send_json.
+    Frames stay text (not bytes) because the dashboard JSON.parses event.data.
+    """
+    return dumps_text(message)
+
+
+class ClientConnection:
+    """A connected WebSocket client with its own bounded send queue"""
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        # Serialized messages, with the latency trace of broadcast sensor data
+        self.queue: "asyncio.Queue[Tuple[str, Optional[Trace]]]" = asyncio.Queue(
+            maxsize=max_queue
+        )
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.consecutive_drops = 0
+        # Sensor subscriptions; a client that never subscribed gets everything
+        self.filtered = False
+        self.sensor_ids: Set[int] = set()
+        self.sensor_types: Set[str] = set()
+        # Audience the client is routed through (see ConnectionManager.connect)
+        self.audience: Optional["Audience"] = None
+
+    def subscription(self) -> Dict[str, Any]:
+        return {
+            "all": not self.filtered,
+            "sensor_ids": sorted(self.sensor_ids),
+            "sensor_types": sorted(self.sensor_types),
+        }
+
+    def enqueue(self, text: str, trace: Optional[Trace] = None) -> bool:
+        """
+        Queue a serialized message without waiting. When the queue is full the
+        oldest message is dropped, so a slow client sees a down-sampled stream.
+        Returns False if a message had to be dropped.
+        """
+        dropped = False
+        if self.queue.full():
+            try:
+                _, dropped_trace = self.queue.get_nowait()
+                if dropped_trace:
+                    dropped_trace.done()
+            except asyncio.QueueEmpty:
+                pass
+            self.dropped += 1
+            self.consecutive_drops += 1
+            dropped = True
+        self.queue.put_nowait((text, trace))
+        return not dropped
+
+
+class Audience:
+    """
+    A set of clients, with the index used to route readings to them: the
+    clients receiving every reading, and sensor ID -> subscribed clients for
+    the rest. The index is rebuilt on subscription changes and whenever the
+    sensor registry changes (new sensors may match a subscribed type).
+    """
+
     def __init__(self):
+        self.clients: Set[ClientConnection] = set()
+        self.unfiltered: Set[ClientConnection] = set()
+        self.index: Dict[int, Set[ClientConnection]] = {}
+        self.index_generation = -1
+
+    def add(self, client: ClientConnection):
+        self.clients.add(client)
+        client.audience = self
+        if client.filtered:
+            self.update(client)
+        else:
+            self.unfiltered.add(client)
+
+    def remove(self, client: ClientConnection):
+        self.clients.discard(client)
+        self.unfiltered.discard(client)
+        if client.filtered:
+            self.rebuild_index()
+
+    def update(self, client: ClientConnection):
+        """Re-index a client after its subscription changed"""
+        if client.filtered:
+            self.unfiltered.discard(client)
+        else:
+            self.unfiltered.add(client)
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        registry = get_sensor_registry()
+        index: Dict[int, Set[ClientConnection]] = {}
+        for client in self.clients:
+            if not client.filtered:
+                continue
+            sensor_ids = set(client.sensor_ids)
+            if client.sensor_types:
+                sensor_ids |= registry.find_by_type(client.sensor_types)
+            for sensor_id in sensor_ids:
+                index.setdefault(sensor_id, set()).add(client)
+        self.index = index
+        self.index_generation = registry.generation
+
+    def route(
+        self, message: Dict[str, Any]
+    ) -> List[Tuple[ClientConnection, Dict[str, Any]]]:
+        """Each recipient with the message it should get (the readings it asked for)"""
+        readings = message.get("readings")
+        if not readings or len(self.unfiltered) == len(self.clients):
+            # Not sensor data, or nobody filters: everyone gets the message
+            return [(client, message) for client in self.clients]
+
+        if self.index_generation != get_sensor_registry().generation:
+            self.rebuild_index()
+
+        positions: Dict[ClientConnection, List[int]] = {}
+        for position, reading in enumerate(readings):
+            for client in self.index.get(reading.get("sensor_id"), ()):
+                positions.setdefault(client, []).append(position)
+
+        routed = [(client, message) for client in self.unfiltered]
+        # Clients asking for the same readings share one message (and one text)
+        subsets: Dict[Tuple[int, ...], Dict[str, Any]] = {}
+        for client, wanted in positions.items():
+            key = tuple(wanted)
+            subset = subsets.get(key)
+            if subset is None:
+                if len(key) == len(readings):
+                    subset = message
+                else:
+                    subset = {**message, "readings": [readings[i] for i in key]}
+                subsets[key] = subset
+            routed.append((client, subset))
+        return routed
+
+
+class ConflatedAudience(Audience):
+    """
+    Clients that asked for at most `max_rate` updates per second. Readings
+    are conflated to the latest value per sensor and flushed to the members
+    at most once per 1 / max_rate seconds; with include_range every reading
+    also carries the min and max seen during its window, so spikes between
+    frames aren't lost. All members share one window, so the cost per
+    broadcast doesn't grow with the number of throttled clients.
+    """
+
+    def __init__(
+        self, manager: "ConnectionManager", max_rate: float, include_range: bool
+    ):
+        super().__init__()
+        self.manager = manager
+        self.max_rate = max_rate
+        self.include_range = include_range
+        self.interval = 1.0 / max_rate
+        self._latest: Dict[Any, Dict[str, Any]] = {}
+        self._range: Dict[Any, List[float]] = {}
+        self._timestamp: Optional[str] = None
+        self._last_flush = float("-inf")
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.conflated = 0
+        self.flushes = 0
+
+    def add_readings(self, message: Dict[str, Any]):
+        """Merge a message's readings into the current window"""
+        include_range = self.include_range
+        for reading in message["readings"]:
+            sensor_id = reading.get("sensor_id")
+            self._latest[sensor_id] = reading
+            if include_range:
+                value = reading["value"]
+                bounds = self._range.get(sensor_id)
+                if bounds is None:
+                    self._range[sensor_id] = [value, value]
+                elif value < bounds[0]:
+                    bounds[0] = value
+                elif value > bounds[1]:
+                    bounds[1] = value
+        self._timestamp = message.get("timestamp")
+        self.conflated += len(message["readings"])
+
+        if self._flush_handle is None:
+            # The first reading after a quiet period goes out straight away
+            loop = asyncio.get_running_loop()
+            delay = max(self._last_flush + self.interval - loop.time(), 0.0)
+            self._flush_handle = loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """Send the window's latest readings to every member"""
+        self._flush_handle = None
+        if not self._latest:
+            return
+        readings = list(self._latest.values())
+        if self.include_range:
+            readings = [
+                {
+                    **reading,
+                    "min": self._range[reading.get("sensor_id")][0],
+                    "max": self._range[reading.get("sensor_id")][1],
+                }
+                for reading in readings
+            ]
+        message = {"timestamp": self._timestamp, "readings": readings}
+        self._latest = {}
+        self._range = {}
+        self._last_flush = asyncio.get_running_loop().time()
+        self.flushes += 1
+        self.manager._deliver(self.route(message))
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+
+class ConnectionManager:
+    """
+    Fan-out broadcaster for WebSocket clients.
+
+    broadcast() serializes each message once and only enqueues it; every
+    client has a writer task that drains its own queue, so one slow client
+    can't delay the others. Clients whose sends fail or time out, or that
+    keep falling behind, are evicted automatically.
+
+    Clients may subscribe to sensor IDs or types. An index from sensor ID to
+    subscribed clients routes each reading only to the clients that asked
+    for it; every distinct subset of a message is serialized once.
+
+    Clients connecting with a max_rate are grouped by delivery policy into
+    ConflatedAudiences, which send them the latest readings at that rate
+    instead of every message.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 100,
+        max_consecutive_drops: int = 500,
+        send_timeout: float = 10.0,
+    ):
+        self.max_queue = max_queue
+        self.max_consecutive_drops = max_consecutive_drops
+        self.send_timeout = send_timeout
         self.active_connections: List[WebSocket] = []
+        self._clients: Dict[WebSocket, ClientConnection] = {}
+        self._evicted = 0
+        # Close handshakes in flight, kept referenced until they finish
+        self._closing: Set[asyncio.Task] = set()
+        # Clients receiving every message as it arrives
+        self._immediate = Audience()
+        # (max_rate, include_range) -> throttled clients with that policy
+        self._conflated: Dict[Tuple[float, bool], ConflatedAudience] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        max_rate: Optional[float] = None,
+        include_range: bool = False,
+    ):
+        """
+        Accept a client. With max_rate it receives conflated readings at most
+        max_rate times a second (with per-window min/max if include_range).
+        """
         await websocket.accept()
+        client = ClientConnection(websocket, self.max_queue)
+        client.writer = asyncio.create_task(self._writer(client))
+        self._clients[websocket] = client
+        if max_rate:
+            policy = (float(max_rate), include_range)
+            audience = self._conflated.get(policy)
+            if audience is None:
+                audience = self._conflated[policy] = ConflatedAudience(self, *policy)
+            audience.add(client)
+        else:
+            self._immediate.add(client)
         self.active_connections.append(websocket)
 
     def disconnect(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        if client and client.audience:
+            audience = client.audience
+            audience.remove(client)
+            if isinstance(audience, ConflatedAudience) and not audience.clients:
+                audience.close()
+                self._conflated.pop((audience.max_rate, audience.include_range), None)
+        if client and client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        if client:
+            # Messages that will never be sent no longer hold their traces open
+            while not client.queue.empty():
+                _, trace = client.queue.get_nowait()
+                if trace:
+                    trace.done()
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), self.send_timeout)
+        except Exception:
+            # Already closed by the peer, or too slow to take the close frame
+            pass
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+    def _evict(self, client: ClientConnection, reason: str):
+        """Drop a client now and close its socket in the background"""
+        logger.warning(f"Evicting WebSocket client: {reason}")
+        self._evicted += 1
+        self.disconnect(client.websocket)
+        task = asyncio.create_task(self._close(client.websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _writer(self, client: ClientConnection):
+        websocket = client.websocket
+        while True:
+            text, trace = await client.queue.get()
             try:
-                await connection.send_json(message)
+                await asyncio.wait_for(websocket.send_text(text), self.send_timeout)
+            except asyncio.CancelledError:
+                if trace:
+                    trace.done()
+                raise
+            except asyncio.TimeoutError:
+                if trace:
+                    trace.done()
+                self._evict(client, f"send timed out after {self.send_timeout}s")
+                return
             except Exception as e:
-                logger.error(f"Error sending to WebSocket: {str(e)}")
-                # We'll handle disconnection in the endpoint
+                if trace:
+                    trace.done()
+                self._evict(client, f"send failed: {str(e)}")
+                return
+            if trace:
+                trace.sent()
+            client.sent += 1
+            client.consecutive_drops = 0
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        sensor_ids: Iterable[int] = (),
+        sensor_types: Iterable[str] = (),
+        all: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Add sensor IDs and/or types to a client's subscription, switching it
+        from "everything" to only those sensors. With all=True the client goes
+        back to receiving everything. Returns the resulting subscription.
+        """
+        client = self._clients.get(websocket)
+        if client is None:
+            return None
+        if all:
+            client.filtered = False
+            client.sensor_ids.clear()
+            client.sensor_types.clear()
+        else:
+            client.filtered = True
+            client.sensor_ids.update(sensor_ids)
+            client.sensor_types.update(t.casefold() for t in sensor_types)
+        if client.audience:
+            client.audience.update(client)
+        return client.subscription()
+
+    def unsubscribe(
+        self,
+        websocket: WebSocket,
+        sensor_ids: Iterable[int] = (),
+        sensor_types: Iterable[str] = (),
+    ) -> Optional[Dict[str, Any]]:
+        """Remove sensor IDs and/or types from a client's subscription"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return None
+        if client.filtered:
+            client.sensor_ids.difference_update(sensor_ids)
+            client.sensor_types.difference_update(t.casefold() for t in sensor_types)
+            if client.audience:
+                client.audience.update(client)
+        return client.subscription()
+
+    def delivery_policy(self, websocket: WebSocket) -> Optional[Dict[str, Any]]:
+        """The rate limit a client connected with, if any"""
+        client = self._clients.get(websocket)
+        if client is None or not isinstance(client.audience, ConflatedAudience):
+            return None
+        return {
+            "max_rate": client.audience.max_rate,
+            "include_range": client.audience.include_range,
+        }
+
+    async def send_personal_message(
+        self, message: Dict[str, Any], websocket: WebSocket
+    ):
+        """Queue a message for a single client behind any pending broadcasts"""
+        client = self._clients.get(websocket)
+        if client:
+            client.enqueue(serialize_message(message))
+
+    def _deliver(
+        self,
+        routed: List[Tuple[ClientConnection, Dict[str, Any]]],
+        trace: Optional[Trace] = None,
+    ):
+        """Enqueue routed messages, serializing each distinct message once"""
+        texts: Dict[int, str] = {}
+        for client, routed_message in routed:
+            text = texts.get(id(routed_message))
+            if text is None:
+                text = texts[id(routed_message)] = serialize_message(routed_message)
+            if (
+                not client.enqueue(text, trace)
+                and client.consecutive_drops >= self.max_consecutive_drops
+            ):
+                self._evict(
+                    client, f"dropped {client.consecutive_drops} messages in a row"
+                )
+
+    async def broadcast(self, message: dict, trace: Optional[Trace] = None):
+        started = time.perf_counter()
+
+        # Throttled clients get sensor readings at their own rate. Anything
+        # else (alerts, non-sensor messages) is also delivered to them at once;
+        # its readings still go into the window so later frames stay current.
+        readings = message.get("readings")
+        immediate = not readings or not message.keys() <= {"timestamp", "readings"}
+        routed = self._immediate.route(message) if self._immediate.clients else []
+        for audience in list(self._conflated.values()):
+            if readings:
+                audience.add_readings(message)
+            if immediate:
+                routed.extend(audience.route(message))
+
+        if trace:
+            if not routed:
+                trace.done()
+            else:
+                # One part per client replaces the part held for the broadcast
+                trace.expect(len(routed) - 1)
+        if routed:
+            self._deliver(routed, trace)
+
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        if trace and routed:
+            trace.mark("enqueue")
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection count, queue depths and drop counters"""
+        depths = [client.queue.qsize() for client in self._clients.values()]
+        return {
+            "connections": len(self._clients),
+            "filtered": sum(client.filtered for client in self._clients.values()),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "sent": sum(client.sent for client in self._clients.values()),
+            "dropped": sum(client.dropped for client in self._clients.values()),
+            "evicted": self._evicted,
+            "throttled": [
+                {
+                    "max_rate": audience.max_rate,
+                    "include_range": audience.include_range,
+                    "clients": len(audience.clients),
+                    "readings_conflated": audience.conflated,
+                    "frames": audience.flushes,
+                }
+                for audience in self._conflated.values()
+            ],
+        }
 
 
 if __name__ == "__main__":